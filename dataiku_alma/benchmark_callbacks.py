@@ -0,0 +1,480 @@
+### Scale benchmark for the callbacks of the QA0 DSS app on synthetic data ###
+# Run from this folder, e.g.: python benchmark_callbacks.py --out benchmark_results.csv
+# The results are a sorted CSV, so two versions of the app can be compared with a plain diff
+
+import argparse
+import csv
+import datetime
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+import dash
+import flask
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.express as px
+
+import utils.queries as queries
+import utils.scatter as scatter
+import utils.spectra as spectra
+import utils.synthetic as synthetic
+
+APP_FILE = "dash_alma_qa0_dss.py"
+
+# (n_scans, n_channels) per UID, each UID has 66 antennas x 4 basebands per scan
+SIZES = [(3, 128), (10, 512), (20, 1024), (2, 8192)]
+
+RESULT_COLUMNS = [
+    "n_scans",
+    "n_channels",
+    "n_rows",
+    "callback",
+    "cold_ms",
+    "warm_ms",
+    "peak_mb",
+    "payload_kb",
+]
+
+
+def load_app(executor):
+    """Execute the DSS app with a pre-initialized app & the given executor, as DSS would"""
+    # The app imports SQLExecutor2 from the dataiku package, which only exists within DSS
+    dataiku = types.ModuleType("dataiku")
+    dataiku.SQLExecutor2 = lambda dataset: executor
+    sys.modules["dataiku"] = dataiku
+
+    namespace = {"__name__": "qa0_app", "__file__": APP_FILE, "app": dash.Dash(__name__)}
+    with open(APP_FILE) as file:
+        exec(compile(file.read(), APP_FILE, "exec"), namespace)
+    # Keep the timings to the foreground work
+    namespace["WATCHER"].stop()
+    # Cold means nothing cached, neither in memory nor on disk
+    namespace["DISK_CACHE"] = None
+    namespace["PREFETCH_UIDS"] = 0
+    namespace["PREFETCH_SCANS"] = 0
+    namespace["PREFETCH_REFERENCES"] = False
+    return namespace
+
+
+class PayloadEncoder(plotly.utils.PlotlyJSONEncoder):
+    def default(self, obj):
+        try:
+            return super().default(obj)
+        # E.g. dash.no_update, which is not sent at all
+        except TypeError:
+            return None
+
+
+class StreamedSize(int):
+    """Number of bytes a route streamed, in place of its response"""
+
+
+def payload_size(output):
+    """Size of the JSON Dash would send to the browser"""
+    if isinstance(output, StreamedSize):
+        return int(output)
+    return len(json.dumps(output, cls=PayloadEncoder))
+
+
+class Session:
+    """Calls the callbacks of a loaded app like the Dash renderer would"""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.app = namespace["app"]
+
+    def call(self, name, *args, trigger="."):
+        # app.callback wraps the function, the original one is kept under __wrapped__
+        func = self.namespace[name]
+        func = getattr(func, "__wrapped__", func)
+        with self.app.server.test_request_context():
+            flask.g.triggered_inputs = [{"prop_id": trigger, "value": None}]
+            return func(*args)
+
+    def download_csv(self, *args):
+        """Post the selection like the download form does & read the CSV a chunk at a time"""
+        path = self.app.config.routes_pathname_prefix + self.namespace["CSV_ROUTE"]
+        selection = self.call("update_csv_selection", *args)
+        response = self.app.server.test_client().post(
+            path, data={"selection": selection}, buffered=False
+        )
+        n_bytes = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return StreamedSize(n_bytes)
+
+
+def run_steps(session, start_date, end_date, graph_type, measure):
+    """Walk through the callback cascade of a typical AoD session, measuring every step"""
+    uid, _ = measure(
+        "update_uid_dropdown", session.call, "update_uid_dropdown", start_date, end_date, None, None
+    )
+    antennas, _ = measure(
+        "update_antenna_dropdown", session.call, "update_antenna_dropdown", uid, []
+    )
+    basebands, _ = measure(
+        "update_baseband_dropdown", session.call, "update_baseband_dropdown", uid, antennas, []
+    )
+    first_scans, _ = measure(
+        "update_scan_dropdown",
+        session.call,
+        "update_scan_dropdown",
+        uid,
+        antennas,
+        basebands,
+        [],
+        None,
+        None,
+        None,
+    )
+    scans, _ = measure(
+        "update_scan_dropdown[all]",
+        session.call,
+        "update_scan_dropdown",
+        uid,
+        antennas,
+        basebands,
+        ["All"],
+        None,
+        None,
+        None,
+        trigger="scan-select-all.value",
+    )
+    measure(
+        "update_summary_graph",
+        session.call,
+        "update_summary_graph",
+        uid,
+        antennas,
+        basebands,
+        graph_type,
+    )
+    # Hovering a point of the summary sends its row id
+    measure(
+        "update_summary_hover",
+        session.call,
+        "update_summary_hover",
+        {"points": [{"customdata": [0]}]},
+        uid,
+        graph_type,
+    )
+    # By default only the first scan is plotted
+    _, shown = measure(
+        "update_spectrum_graph",
+        session.call,
+        "update_spectrum_graph",
+        uid,
+        antennas,
+        basebands,
+        first_scans,
+        None,
+        graph_type,
+        "scatter",
+        None,
+    )
+    # Ticking one more scan only sends the traces of that scan
+    measure(
+        "update_spectrum_graph[+1 scan]",
+        session.call,
+        "update_spectrum_graph",
+        uid,
+        antennas,
+        basebands,
+        scans[: len(first_scans) + 1],
+        None,
+        graph_type,
+        "scatter",
+        shown,
+        trigger="scan-select.value",
+    )
+    # Cold, this includes building the reference spectra
+    measure(
+        "update_spectrum_graph[deviation]",
+        session.call,
+        "update_spectrum_graph",
+        uid,
+        antennas,
+        basebands,
+        first_scans,
+        None,
+        graph_type,
+        "deviation",
+        None,
+    )
+    # The waterfall is meant for every scan at once
+    measure(
+        "update_spectrum_graph[waterfall]",
+        session.call,
+        "update_spectrum_graph",
+        uid,
+        antennas,
+        basebands,
+        scans,
+        None,
+        graph_type,
+        "waterfall",
+        None,
+    )
+    _, baseband, _, scan = measure(
+        "update_correlation_controls",
+        session.call,
+        "update_correlation_controls",
+        basebands,
+        first_scans,
+        None,
+        None,
+    )
+    # Cold, this includes computing the antenna x antenna matrix
+    matrix = measure(
+        "update_correlation_graph",
+        session.call,
+        "update_correlation_graph",
+        uid,
+        antennas,
+        baseband,
+        scan,
+        graph_type,
+        "correlation",
+    )
+    names = matrix["data"][0]["x"] if matrix["data"] else []
+    if len(names) > 1:
+        measure(
+            "update_correlation_detail",
+            session.call,
+            "update_correlation_detail",
+            {"points": [{"x": names[1], "y": names[0]}]},
+            uid,
+            baseband,
+            scan,
+            graph_type,
+        )
+    measure("download_csv", session.download_csv, uid, antennas, basebands, scans)
+
+
+def benchmark_size(n_scans, n_channels, n_uids, repeat, graph_type):
+    df = synthetic.generate_dataset(n_uids=n_uids, n_scans=n_scans, n_channels=n_channels)
+    executor = synthetic.SQLiteExecutor(df, queries.DATASET_NAME)
+    start_date, end_date = df.day.min(), df.day.max() + " 23:59:59"
+    results = {}
+
+    def record(name, key, value):
+        results.setdefault(name, {}).setdefault(key, []).append(value)
+
+    # Cold: fresh app, so every cache is empty
+    def measure_cold(name, func, *args, **kwargs):
+        t_start = time.perf_counter()
+        output = func(*args, **kwargs)
+        record(name, "cold_ms", (time.perf_counter() - t_start) * 1e3)
+        record(name, "payload_kb", payload_size(output) / 1e3)
+        return output
+
+    run_steps(Session(load_app(executor)), start_date, end_date, graph_type, measure_cold)
+
+    # Peak memory, again on a fresh app as tracemalloc slows everything down
+    def measure_memory(name, func, *args, **kwargs):
+        tracemalloc.start()
+        output = func(*args, **kwargs)
+        record(name, "peak_mb", tracemalloc.get_traced_memory()[1] / 1e6)
+        tracemalloc.stop()
+        return output
+
+    run_steps(Session(load_app(executor)), start_date, end_date, graph_type, measure_memory)
+
+    # Warm: the same app called again, as when the AoD goes back & forth
+    def measure_warm(name, func, *args, **kwargs):
+        t_start = time.perf_counter()
+        output = func(*args, **kwargs)
+        record(name, "warm_ms", (time.perf_counter() - t_start) * 1e3)
+        return output
+
+    session = Session(load_app(executor))
+    run_steps(
+        session, start_date, end_date, graph_type, lambda name, func, *a, **kw: func(*a, **kw)
+    )
+    for _ in range(repeat):
+        run_steps(session, start_date, end_date, graph_type, measure_warm)
+
+    n_rows = len(df) // n_uids
+    return [
+        {
+            "n_scans": n_scans,
+            "n_channels": n_channels,
+            "n_rows": n_rows,
+            "callback": name,
+            **{key: "%.2f" % statistics.median(values) for key, values in metrics.items()},
+        }
+        for name, metrics in results.items()
+    ]
+
+
+def compare_figures(expected, actual, path="figure"):
+    """Differences between two figure dicts, with arrays compared to tolerance"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        if set(expected) != set(actual):
+            return ["%s: keys %s != %s" % (path, sorted(expected), sorted(actual))]
+        return sum([compare_figures(expected[k], actual[k], path + "." + k) for k in expected], [])
+    if isinstance(expected, (list, tuple)) and any(isinstance(v, (dict, list)) for v in expected):
+        if len(expected) != len(actual):
+            return ["%s: length %d != %d" % (path, len(expected), len(actual))]
+        return sum(
+            [
+                compare_figures(e, a, "%s[%d]" % (path, i))
+                for i, (e, a) in enumerate(zip(expected, actual))
+            ],
+            [],
+        )
+    if isinstance(expected, (list, tuple, np.ndarray)) and isinstance(
+        actual, (list, tuple, np.ndarray)
+    ):
+        expected, actual = np.asarray(expected), np.asarray(actual)
+        if expected.shape != actual.shape:
+            return ["%s: shape %s != %s" % (path, expected.shape, actual.shape)]
+        if expected.size and isinstance(expected.flat[0], datetime.datetime):
+            # plotly validates datetimes into datetime objects, the lean figures carry ISO strings
+            equal = (
+                pd.to_datetime(expected.ravel()) == pd.to_datetime(actual.ravel().astype(str))
+            ).all()
+        elif expected.dtype.kind in "fi" and actual.dtype.kind in "fi":
+            equal = np.allclose(expected, actual)
+        else:
+            equal = (expected.astype(object) == actual.astype(object)).all()
+        return [] if equal else ["%s: values differ" % path]
+    if isinstance(expected, float) and isinstance(actual, float):
+        return [] if np.isclose(expected, actual) else ["%s: %r != %r" % (path, expected, actual)]
+    return [] if expected == actual else ["%s: %r != %r" % (path, expected, actual)]
+
+
+def check_figures(df, graph_labels):
+    """Compare the lean figure builder against plotly express for the figures of the app"""
+    df = df.assign(rowid=np.arange(len(df)))
+    uid_df = df.loc[df.uid == df.uid.iloc[0]]
+    summary_labels = {"value": "Temperature", "variable": "Polarization", **graph_labels}
+    summary = dict(
+        x="startvalidtime",
+        y=["trec_x", "trec_y"],
+        facet_col="basebandname",
+        facet_col_wrap=2,
+        labels=summary_labels,
+    )
+
+    # Exploded spectra of the first scan, as the spectrum graph plots them
+    scan_df = spectra.decode_spectra(uid_df.loc[uid_df.caldataid == uid_df.caldataid.iloc[0]])
+    lengths = scan_df.frequencyspectrum.map(len).to_numpy()
+    spectrum_cols = ["frequencyspectrum", "trecspectrum_x", "trecspectrum_y"]
+    add_cols = ["antennaname", "basebandname", "caldataid"]
+    columns = {col: np.concatenate(scan_df[col].to_numpy()) for col in spectrum_cols}
+    columns.update({col: np.repeat(scan_df[col].to_numpy(), lengths) for col in add_cols})
+
+    cases = {
+        "summary[lean]": (uid_df, dict(summary, custom_data=["rowid"])),
+        "summary[full]": (
+            uid_df,
+            dict(
+                summary,
+                hover_name="antennaname",
+                hover_data={
+                    "frequency_mid": ":.2f",
+                    "startvalidtime": False,
+                    "caldataid": True,
+                    "value": ":.2f [K]",
+                },
+                custom_data=["rowid", "frequency_mid"],
+            ),
+        ),
+        "summary[datetime]": (
+            uid_df.assign(startvalidtime=pd.to_datetime(uid_df.startvalidtime)),
+            dict(summary, custom_data=["rowid"]),
+        ),
+        "summary[3 basebands]": (
+            uid_df.loc[uid_df.basebandname != "BB_4"],
+            dict(summary, custom_data=["rowid"]),
+        ),
+        "spectrum": (
+            columns,
+            dict(
+                x="frequencyspectrum",
+                y=spectrum_cols[1:],
+                labels={"variable": "Polarization", "value": "Temperature", **graph_labels},
+                hover_data={col: True for col in add_cols},
+            ),
+        ),
+    }
+
+    differences = []
+    for name, (data, kwargs) in cases.items():
+        expected = px.scatter(
+            pd.DataFrame(data), render_mode="webgl", template="plotly_dark", **kwargs
+        ).to_plotly_json()
+        actual = scatter.scatter(data, template="plotly_dark", **kwargs)
+        differences += compare_figures(expected, actual, name)
+    return differences
+
+
+def check_waterfall(df, build_waterfall_figure):
+    """Check that a single hot antenna stands out in the waterfall of all antennas"""
+    uid_df = spectra.decode_spectra(df.loc[(df.uid == df.uid.iloc[0]) & ~df.is_outlier])
+    hot_antenna = uid_df.antennaname.iloc[0]
+    hot = (uid_df.antennaname == hot_antenna).to_numpy()
+    uid_df.loc[hot, "trecspectrum_x"] = uid_df.loc[hot, "trecspectrum_x"].map(lambda s: s * 3)
+
+    differences = []
+    for trace in build_waterfall_figure(uid_df, ["trecspectrum_x"])["data"]:
+        rows = np.array([label.split(" ")[0] == hot_antenna for label in trace["y"]])
+        hot_mean = np.nanmean(trace["z"][rows])
+        other_mean = np.nanmean(trace["z"][~rows])
+        if not hot_mean > 2 * other_mean:
+            differences.append(
+                "waterfall.%s: hot antenna %.1f vs others %.1f"
+                % (trace["xaxis"], hot_mean, other_mean)
+            )
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the QA0 callbacks on synthetic data")
+    parser.add_argument("--out", default="benchmark_results.csv", help="Results CSV")
+    parser.add_argument("--uids", type=int, default=2, help="Number of UIDs in the dataset")
+    parser.add_argument("--repeat", type=int, default=3, help="Warm repetitions per callback")
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=["%d:%d" % size for size in SIZES],
+        help="n_scans:n_channels per UID",
+    )
+    parser.add_argument("--graph-type", default="startvalidtime,trec_x,trec_y")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only check the lean figures against plotly express & the waterfall",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        df = synthetic.generate_dataset(n_uids=1, n_scans=3, n_channels=128)
+        executor = synthetic.SQLiteExecutor(df, queries.DATASET_NAME)
+        namespace = load_app(executor)
+        differences = check_figures(df, namespace["GRAPH_LABELS"])
+        differences += check_waterfall(df, namespace["build_waterfall_figure"])
+        print("\n".join(differences) or "Lean figures match plotly express & the waterfall")
+        sys.exit(1 if differences else 0)
+
+    rows = []
+    for size in args.sizes:
+        n_scans, n_channels = map(int, size.split(":"))
+        print("Benchmarking %d scans x %d channels" % (n_scans, n_channels))
+        rows += benchmark_size(n_scans, n_channels, args.uids, args.repeat, args.graph_type)
+
+    rows.sort(key=lambda row: (row["n_scans"], row["n_channels"], row["callback"]))
+    with open(args.out, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print("Wrote %d results to %s" % (len(rows), args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 ### Dash App for Alma's Astronomer on Duty, who performs Quality Assurance 0 Tasks ###
 
+import json
+import os
+import tempfile
+import threading
+
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
-import plotly.express as px
+import flask
 import plotly.graph_objs as go
 
 import numpy as np
@@ -12,7 +17,17 @@ import pandas as pd
 
 from dataiku import SQLExecutor2
 
+import utils.caching as caching
+import utils.correlation as correlation
 import utils.dash_reusable_components as drc
+import utils.disk_cache as disk_cache
+import utils.layout_cache as layout_cache
+import utils.queries as queries
+import utils.reference as reference
+import utils.scatter as scatter
+import utils.search as search
+import utils.spectra as spectra
+import utils.streaming as streaming
 
 ### DEFINITIONS ###
 
@@ -24,42 +39,420 @@ app.config.external_stylesheets = [
 
 EXECUTOR = SQLExecutor2(dataset="raw_cal_joined")
 
-DATASET_NAME = "TRENDANALYSISANDOUTLIERDETECTION_raw_cal_joined"
 
-# SQL Queries
-# Quotes needed due to caps
-unique_uid_query = """
-SELECT DISTINCT uid
-FROM "%s"
-ORDER BY uid DESC
-"""
+def get_date(query=queries.min_date_query):
+    return EXECUTOR.query_to_df(query % (queries.DATASET_NAME)).values.tolist()[0][0]
+
+
+### DATA ACCESS ###
+# Callbacks for the same UID fire in cascades, so keep the fetched UIDs & the decoded spectra
+# in memory instead of re-querying & re-parsing them for every callback
+
+# Keyed by data version
+DATE_RANGE_CACHE = caching.LRUCache(maxsize=1)
+# Keyed by uid
+UID_CACHE = caching.LRUCache(maxsize=16)
+# Antennas, basebands & scans of a UID, keyed by uid
+UID_CATALOG = caching.LRUCache(maxsize=256)
+# Searchable dropdown options, keyed by (start date, end date, data version) for UIDs
+# & by (uid, antennas, basebands) for scans
+UID_INDEX_CACHE = caching.LRUCache(maxsize=32)
+SCAN_INDEX_CACHE = caching.LRUCache(maxsize=64)
+# With 800+ UIDs & thousands of scans only send the best matches of a search to the browser
+MAX_OPTIONS = 50
+# Keyed by (uid, caldataid), bounded by bytes as a scan of 8192 channels takes tens of MB
+SPECTRUM_CACHE = caching.LRUCache(maxsize=512, maxbytes=4e9, sizeof=spectra.frame_bytes)
+# Antenna x antenna matrices, keyed by (uid, baseband, scan, spectrum columns, metric)
+CORRELATION_CACHE = caching.LRUCache(maxsize=128)
+# Keyed by (uid, antennas, basebands, graph type)
+SUMMARY_FIGURE_CACHE = caching.LRUCache(maxsize=64)
+
+# Fetched UIDs with decoded spectra also go to disk, so they survive worker restarts & deploys
+# & are shared by all workers on the host, keyed by uid & the version of its rows
+DISK_CACHE_DIR = os.path.join(tempfile.gettempdir(), "alma_qa0_cache")
+DISK_CACHE = disk_cache.DiskCache(DISK_CACHE_DIR, max_bytes=20e9) if disk_cache.AVAILABLE else None
+
+# The AoD almost always picks the newest UID & looks at the first few scans,
+# so warm those in the background
+PREFETCHER = caching.Prefetcher(max_workers=2, max_pending=8)
+PREFETCH_UIDS = 3
+PREFETCH_SCANS = 3
+PREFETCH_REFERENCES = True
+
+# Reference spectrum per antenna, baseband & receiverband: the rolling median over the mean good
+# spectra of its newest observations. The first build looks back REFERENCE_DAYS, later ones only
+# add the UIDs that got new rows.
+REFERENCES = reference.ReferenceSpectra(window=10)
+REFERENCE_DAYS = 7
+REFERENCE_LOCK = threading.Lock()
+# References on the frequencies of a UID, keyed by (uid, antenna, baseband, receiverband, column)
+REFERENCE_CACHE = caching.LRUCache(maxsize=4096)
+
+
+def get_data_version():
+    """Newest scan timestamp seen by the watcher, it moves whenever new data arrives"""
+    # If the first poll of the watcher failed, poll here, otherwise entries cached under a None
+    # version would never see the changes the watcher only reports from its second poll on
+    if WATCHER.stamp is None:
+        WATCHER.check()
+    return WATCHER.stamp
+
+
+def get_date_range():
+    """Get the MIN & MAX startvalidtime, only re-querying them when the data version moves"""
+    query = queries.date_range_query % (queries.DATASET_NAME)
+    return DATE_RANGE_CACHE.get_or_compute(
+        get_data_version(), lambda: tuple(EXECUTOR.query_to_df(query).values.tolist()[0])
+    )
+
+
+def get_uid_version(uid):
+    """Newest scan & row count of a UID, they change whenever rows of it are added or removed"""
+    return EXECUTOR.query_to_df(
+        queries.uid_version_query % (queries.DATASET_NAME, uid)
+    ).values.tolist()[0]
+
+
+def load_uid_df(uid):
+    """Query all rows of a UID from the database, unless the disk cache has them"""
+    if DISK_CACHE is not None:
+        version = get_uid_version(uid)
+        df = DISK_CACHE.get(uid, version)
+        if df is not None:
+            return df
+
+    # Fetched as Arrow batches, which takes far less memory than building the df row by row
+    df = streaming.read_df(EXECUTOR, queries.uid_subset_query % (queries.DATASET_NAME, uid))
+    # Compact id per row, summary points carry it so selections resolve to rows in one lookup.
+    # The query orders the rows by their key, so the ids stay valid for figures built from an
+    # earlier fetch of the UID, e.g. before it was evicted from UID_CACHE.
+    df["rowid"] = np.arange(len(df))
+
+    # Decoding & writing all spectra takes a while, so leave it to the background
+    if DISK_CACHE is not None and len(df):
+        PREFETCHER.submit(("disk", uid), store_uid_df, uid, version, df)
+    return df
+
+
+def store_uid_df(uid, version, df):
+    """Write the rows of a UID with decoded spectra to the disk cache, decoding a batch at a time
+
+    Rows that got outdated while decoding, e.g. because new rows arrived, are not written, as they
+    would replace the fresh version.
+    """
+    DISK_CACHE.set_frames(
+        uid,
+        version,
+        (
+            # Only the decoded spectra, so loaded UIDs do not hold both
+            spectra.with_decoded_spectra(df.iloc[start : start + streaming.BATCH_SIZE]).drop(
+                columns=spectra.SPECTRUM_COLUMNS
+            )
+            for start in range(0, len(df), streaming.BATCH_SIZE)
+        ),
+        valid=lambda: get_uid_version(uid) == version,
+    )
+
+
+def iter_uid_frames(uid):
+    """Rows of a UID a batch at a time, streamed from the database unless cached
+
+    UIDs loaded from the disk cache only hold decoded spectra, so they are streamed as well.
+    """
+    df = UID_CACHE.get(uid)
+    if df is not None and set(spectra.SPECTRUM_COLUMNS) <= set(df.columns):
+        for start in range(0, len(df), streaming.BATCH_SIZE):
+            yield df.iloc[start : start + streaming.BATCH_SIZE]
+        return
+
+    offset = 0
+    for frame in streaming.iter_frames(
+        EXECUTOR, queries.uid_subset_query % (queries.DATASET_NAME, uid)
+    ):
+        # Number the rows across batches, as in a df of the whole UID
+        frame.index += offset
+        offset += len(frame)
+        yield frame
+
+
+def get_uid_df(uid):
+    """Get df of a UID, only hitting the database on a cache miss"""
+    df = UID_CACHE.get(uid)
+    if df is None:
+        with PREFETCHER.foreground():
+            df = UID_CACHE.get_or_compute(uid, lambda: load_uid_df(uid))
+    return df
+
+
+def get_catalog_entry(uid):
+    """Get the antennas, basebands & scans of a UID"""
+
+    def build_entry():
+        df = get_uid_df(uid)
+        return {
+            "antennas": df.antennaname.unique().tolist(),
+            "basebands": df.basebandname.unique().tolist(),
+            "scans": df.caldataid.unique().tolist(),
+        }
+
+    return UID_CATALOG.get_or_compute(uid, build_entry)
+
+
+def get_uid_index(start_date, end_date):
+    """Get the searchable UIDs of a date range, newest first"""
+
+    def build_index():
+        uids = (
+            EXECUTOR.query_to_df(
+                queries.filter_date_query % (queries.DATASET_NAME, start_date, end_date)
+            )
+            .uid.unique()
+            .tolist()
+        )
+        return search.OptionIndex([{"label": i.strip("uid://"), "value": i} for i in uids[::-1]])
+
+    return UID_INDEX_CACHE.get_or_compute((start_date, end_date, get_data_version()), build_index)
+
+
+def get_scan_index(uid, antennas, basebands):
+    """Get the searchable scans of the selected antennas & basebands of a UID"""
+
+    def build_index():
+        # Get df of currently selected UID
+        df = get_uid_df(uid)
+
+        # Note that scans == caldataid ~= startvalidtime
+        scans = (
+            df.loc[
+                (df.uid == uid)
+                & (df.antennaname.isin(antennas))
+                & (df.basebandname.isin(basebands)),
+                "caldataid",
+            ]
+            .unique()
+            .tolist()
+        )
+        return search.OptionIndex([{"label": i, "value": i} for i in scans])
+
+    return SCAN_INDEX_CACHE.get_or_compute((uid, tuple(antennas), tuple(basebands)), build_index)
+
+
+def get_rows(uid, rowids):
+    """Rows of a UID by row id, which is the position of a row"""
+    df = get_uid_df(uid)
+    rows = np.unique(np.asarray(rowids, dtype=int))
+    # Leave out ids beyond the current df, e.g. of a selection made on a larger UID
+    return df.iloc[rows[(rows >= 0) & (rows < len(df))]]
+
+
+def get_selected_rows(uid, summary_selected):
+    """Rows of a UID selected in the summary graph, resolved via the row ids its points carry"""
+    return get_rows(uid, [point["customdata"][0] for point in summary_selected["points"]])
 
-# Somehow WHERE needs single quotes
-uid_subset_query = """
-SELECT *
-FROM "%s"
-WHERE uid = '%s'
-"""
 
-min_date_query = """
-SELECT MIN(startvalidtime)
-FROM "%s"
-"""
+def decode_scans(uid, scans):
+    """Decode the spectra of the given scans of a UID into SPECTRUM_CACHE
+
+    Returns dict of scan -> df of the scans the UID has, as decoded here or by a prefetch job
+    """
+    df = UID_CACHE.get_or_compute(uid, lambda: load_uid_df(uid))
+    scans_df = df.loc[df.caldataid.isin(scans)]
+    decoded = {}
+    for scan, scan_df in scans_df.groupby("caldataid", sort=False):
+        # Scans a prefetch job is decoding right now are waited for, not decoded twice
+        decoded[scan] = SPECTRUM_CACHE.get_or_compute(
+            (uid, scan),
+            lambda scan_df=scan_df: spectra.decode_spectra(scan_df.reset_index(drop=True)),
+        )
+    return decoded
+
+
+def get_scan_spectra(uid, scans):
+    """Get dict of scan -> df with decoded spectra, only decoding scans not yet cached
+
+    The frames decoded here are returned as they are, not read back from the cache, where a large
+    selection could have evicted them already.
+    """
+    scan_spectra = {}
+    for scan in scans:
+        scan_df = SPECTRUM_CACHE.get((uid, scan))
+        if scan_df is not None:
+            scan_spectra[scan] = scan_df
+    missing = [scan for scan in scans if scan not in scan_spectra]
+    if missing:
+        with PREFETCHER.foreground():
+            scan_spectra.update(decode_scans(uid, missing))
+    return {scan: scan_spectra[scan] for scan in scans if scan in scan_spectra}
+
+
+def get_antenna_matrix(uid, baseband, scan, columns, metric):
+    """Correlation or distance of the spectra of every pair of antennas in a scan & baseband
+
+    The spectra of the columns of every antenna are stacked into one row of a matrix, so all pairs
+    come out of a single vectorized operation. Returns the antennas & the matrix.
+    """
+
+    def build_matrix():
+        scan_df = get_scan_spectra(uid, [scan]).get(scan)
+        if scan_df is None:
+            return [], np.empty((0, 0))
+        scan_df = scan_df.loc[scan_df.basebandname == baseband]
+        matrix, rows = correlation.stack_spectra(
+            [[row[col] for col in columns] for _, row in scan_df.iterrows()]
+        )
+        if not rows:
+            return [], np.empty((0, 0))
+        return scan_df.antennaname.iloc[rows].tolist(), correlation.pairwise_matrix(matrix, metric)
+
+    return CORRELATION_CACHE.get_or_compute(
+        (uid, baseband, scan, tuple(columns), metric), build_matrix
+    )
 
-max_date_query = """
-SELECT MAX(startvalidtime)
-FROM "%s"
-"""
 
-filter_date_query = """
-SELECT DISTINCT uid
-FROM "%s"
-WHERE startvalidtime >= '%s' AND startvalidtime <= '%s'
-"""
+def warm_uid(uid):
+    """Fetch a UID & decode its first scans"""
+    df = UID_CACHE.get_or_compute(uid, lambda: load_uid_df(uid))
+    warm_scans(uid, df.caldataid.unique()[:PREFETCH_SCANS])
 
 
-def get_date(query=min_date_query):
-    return EXECUTOR.query_to_df(query % (DATASET_NAME)).values.tolist()[0][0]
+def warm_scans(uid, scans):
+    """Decode the given scans unless they are already cached"""
+    missing = [scan for scan in scans if (uid, scan) not in SPECTRUM_CACHE]
+    if missing:
+        decode_scans(uid, missing)
+
+
+def update_references():
+    """Add the good observations since the last update to the reference spectra"""
+    with REFERENCE_LOCK:
+        since = REFERENCES.stamp
+        if since is None:
+            newest = pd.Timestamp(get_date(query=queries.max_date_query))
+            since = (newest - pd.Timedelta(days=REFERENCE_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+
+        # Mean spectra per UID & key, summed up a batch at a time
+        columns = list(SUMMARY_SPECTRUM_MAP.values())
+        accumulators, stamps = {}, {}
+        query = queries.reference_query % (queries.DATASET_NAME, queries.DATASET_NAME, since)
+        for df in streaming.iter_frames(EXECUTOR, query):
+            df = spectra.decode_spectra(df)
+            # The spectra of a key & length stack into 2-D arrays, summed up in one operation
+            groups = df.groupby(
+                [
+                    "uid",
+                    "antennaname",
+                    "basebandname",
+                    "receiverband",
+                    df.frequencyspectrum.map(len),
+                ],
+                sort=False,
+                dropna=False,
+            ).indices
+            for (*key, _), rows in groups.items():
+                key = tuple(key)
+                frequencies = np.stack(df.frequencyspectrum.to_numpy()[rows])
+                if key not in accumulators:
+                    accumulators[key] = reference.SpectrumAccumulator(frequencies[0])
+                accumulators[key].add(
+                    frequencies, {col: np.stack(df[col].to_numpy()[rows]) for col in columns}
+                )
+            for uid, stamp in df.groupby("uid").startvalidtime.max().items():
+                stamps[uid] = max(stamps.get(uid, ""), str(stamp))
+
+        for (uid, *key), accumulator in accumulators.items():
+            REFERENCES.add(
+                uid, tuple(key), accumulator.frequency, accumulator.means(), stamp=stamps[uid]
+            )
+        # Also without any good rows, so the next update does not search the same window again
+        REFERENCES.update_stamp(since)
+        REFERENCE_CACHE.clear()
+
+
+def get_reference(uid, antenna, baseband, receiverband, column, frequency):
+    """Reference spectrum of a column on the given frequencies, leaving out the UID itself"""
+    return REFERENCE_CACHE.get_or_compute(
+        (uid, antenna, baseband, receiverband, column),
+        lambda: REFERENCES.reference(
+            (antenna, baseband, receiverband), column, frequency, exclude=uid
+        ),
+    )
+
+
+def with_residuals(uid, graph_df, columns):
+    """Copy of graph_df with the spectra of columns replaced by their deviation from the reference"""
+    if REFERENCES.stamp is None:
+        update_references()
+
+    graph_df = graph_df.copy()
+    frequencies = graph_df.frequencyspectrum.to_numpy()
+    # The spectra of a key & length stack into 2-D arrays, which share one reference
+    groups = graph_df.groupby(
+        ["antennaname", "basebandname", "receiverband", graph_df.frequencyspectrum.map(len)],
+        sort=False,
+        dropna=False,
+    ).indices
+    for column in columns:
+        values = graph_df[column].to_numpy()
+        deviations = np.empty(len(graph_df), dtype=object)
+        for (antenna, baseband, receiverband, n_channels), rows in groups.items():
+            ref = get_reference(uid, antenna, baseband, receiverband, column, frequencies[rows[0]])
+            # References without history or on other frequencies leave the channels as NaN
+            if ref is None or len(ref) != n_channels:
+                ref = np.nan
+            for row, deviation in zip(rows, np.stack(values[rows]) - ref):
+                deviations[row] = deviation
+        graph_df[column] = deviations
+    return graph_df
+
+
+def invalidate_uid(uid):
+    """Drop everything cached for a UID, e.g. because new rows arrived for it
+
+    Computations of the UID in flight are dropped too, so they cannot write their stale results
+    back once they finish.
+    """
+    UID_CACHE.pop(uid)
+    UID_CATALOG.pop(uid)
+    if DISK_CACHE is not None:
+        DISK_CACHE.pop(uid)
+    for cache in [
+        SPECTRUM_CACHE,
+        SCAN_INDEX_CACHE,
+        SUMMARY_FIGURE_CACHE,
+        REFERENCE_CACHE,
+        CORRELATION_CACHE,
+    ]:
+        cache.invalidate(lambda key: key[0] == uid)
+
+
+def warm_new_uid(uid):
+    """Pre-build everything the default view of a freshly ingested UID shows"""
+    entry = get_catalog_entry(uid)
+    warm_scans(uid, entry["scans"][:PREFETCH_SCANS])
+    # By default all antennas & basebands are selected with the first summary graph type
+    get_summary_figure(
+        uid, entry["antennas"], entry["basebands"], SUMMARY_GRAPH_OPTIONS[0]["value"]
+    )
+
+
+def on_new_data(old_date, new_date):
+    """Invalidate & pre-warm the UIDs that got rows since old_date"""
+    uids = EXECUTOR.query_to_df(
+        queries.new_uids_query % (queries.DATASET_NAME, old_date)
+    ).uid.tolist()
+    for uid in uids:
+        invalidate_uid(uid)
+        PREFETCHER.submit(("new", uid), warm_new_uid, uid)
+    # Only extend references that were built already
+    if REFERENCES.stamp is not None:
+        PREFETCHER.submit(("references",), update_references)
+
+
+# With ALMA ingesting continuously, poll the newest scan timestamp so fresh observations are
+# already hot when the AoD opens them
+WATCHER = caching.Watcher(
+    poll=lambda: get_date(query=queries.max_date_query), on_change=on_new_data, interval=60
+)
 
 
 SUMMARY_GRAPH_OPTIONS = [
@@ -76,6 +469,35 @@ SUMMARY_GRAPH_OPTIONS = [
 ]
 
 
+# Lean figures only carry a row id per point & the hover details are looked up on demand,
+# which keeps the summary figure payload down to little more than the x/y arrays
+LEAN_FIGURES = True
+
+
+# Waterfall bins the spectra of every antenna & baseband into a scan x frequency heatmap within
+# a fixed pixel budget, so its size does not grow with the number of scans & channels plotted
+SPECTRUM_GRAPH_OPTIONS = [
+    {"label": "Scatter", "value": "scatter"},
+    {"label": "Waterfall", "value": "waterfall"},
+    {"label": "Deviation from Reference", "value": "deviation"},
+]
+
+# Scan rows per antenna & frequency bins shared by the basebands side by side
+WATERFALL_SCAN_BINS = 200
+WATERFALL_FREQUENCY_BINS = 400
+# Over all antennas, each gets at least one row of scans though
+WATERFALL_PIXELS = WATERFALL_SCAN_BINS * WATERFALL_FREQUENCY_BINS
+
+
+# Path of the CSV download, relative to the app
+CSV_ROUTE = "download-csv"
+
+CORRELATION_METRIC_OPTIONS = [
+    {"label": "Correlation", "value": "correlation"},
+    {"label": "RMS Distance (K)", "value": "distance"},
+]
+
+
 SUMMARY_SPECTRUM_MAP = {
     "trec_x": "trecspectrum_x",
     "trec_y": "trecspectrum_y",
@@ -108,6 +530,7 @@ GRAPH_LABELS = {
 
 def panel_layout():
     """Layout for the upper-left Panel"""
+    min_date, max_date = get_date_range()
     return html.Div(
         id="left-column",
         children=[
@@ -129,11 +552,11 @@ def panel_layout():
                                 children=[
                                     dcc.DatePickerRange(
                                         id="date-picker-range",
-                                        # Put the SQL queries into the layout to refresh dynamically
-                                        min_date_allowed=get_date(query=min_date_query),
-                                        max_date_allowed=get_date(query=max_date_query),
-                                        start_date=get_date(query=max_date_query),
-                                        end_date=get_date(query=max_date_query),
+                                        # Refreshed whenever the data version moves
+                                        min_date_allowed=min_date,
+                                        max_date_allowed=max_date,
+                                        start_date=max_date,
+                                        end_date=max_date,
                                     )
                                 ],
                             ),
@@ -144,7 +567,7 @@ def panel_layout():
                         name="Select Observation UID",
                         id="dropdown-select-uid",
                         clearable=False,
-                        searchable=False,
+                        searchable=True,
                     ),
                     ### ANTENNAS ###
                     html.Div(
@@ -230,12 +653,29 @@ def panel_layout():
                             ),
                         ],
                     ),
+                    ### SPECTRUM GRAPH TYPE ###
+                    drc.NamedDropdown(
+                        name="Select Spectrum Graph",
+                        id="dropdown-select-spectrum-graph",
+                        options=SPECTRUM_GRAPH_OPTIONS,
+                        clearable=False,
+                        searchable=False,
+                        value=SPECTRUM_GRAPH_OPTIONS[0]["value"],
+                    ),
                     ### DOWNLOAD BUTTON ###
-                    html.Div(
+                    # Posts the selection to download_csv, which streams the CSV
+                    html.Form(
+                        action=app.get_relative_path("/" + CSV_ROUTE),
+                        method="post",
                         style={"margin": "40px 0px"},
                         children=[
-                            html.Button("Download CSV", id="btn", style={"color": "lightblue"}),
-                            dcc.Download(id="download"),
+                            dcc.Input(id="csv-selection", name="selection", type="hidden"),
+                            html.Button(
+                                "Download CSV",
+                                id="btn",
+                                type="submit",
+                                style={"color": "lightblue"},
+                            ),
                         ],
                     ),
                 ],
@@ -263,19 +703,61 @@ def graph_layout():
                     },
                 ),
             ),
+            # Details of the hovered summary point, looked up on demand
+            html.Div(
+                id="summary-hover-details", style={"margin": "5px 10px", "min-height": "20px"}
+            ),
             dcc.Loading(
                 className="graph-wrapper",
-                children=dcc.Graph(
-                    id="spectrum-graph",
-                    config={
-                        "modeBarButtonsToAdd": [
-                            "drawline",
-                            "drawopenpath",
-                            "drawrect",
-                            "eraseshape",
-                        ]
-                    },
-                ),
+                children=[
+                    dcc.Graph(
+                        id="spectrum-graph",
+                        config={
+                            "modeBarButtonsToAdd": [
+                                "drawline",
+                                "drawopenpath",
+                                "drawrect",
+                                "eraseshape",
+                            ]
+                        },
+                    ),
+                    # Operations on the spectrum graph & the scans it shows, see update_spectrum_graph
+                    dcc.Store(id="spectrum-graph-ops"),
+                    dcc.Store(id="spectrum-graph-state"),
+                ],
+            ),
+            # All antennas of a scan & baseband against each other, a click shows the two spectra
+            html.Div(
+                id="correlation-controls",
+                style={"display": "flex", "align-items": "center", "margin": "5px 10px"},
+                children=[
+                    dcc.Dropdown(
+                        id="correlation-baseband",
+                        clearable=False,
+                        placeholder="BaseBand",
+                        style={"width": "150px", "margin-right": "10px"},
+                    ),
+                    dcc.Dropdown(
+                        id="correlation-scan",
+                        clearable=False,
+                        placeholder="Scan",
+                        style={"width": "150px", "margin-right": "10px"},
+                    ),
+                    dcc.RadioItems(
+                        id="correlation-metric",
+                        options=CORRELATION_METRIC_OPTIONS,
+                        value=CORRELATION_METRIC_OPTIONS[0]["value"],
+                        labelStyle={"display": "inline-block", "margin-right": "10px"},
+                    ),
+                ],
+            ),
+            dcc.Loading(
+                className="graph-wrapper",
+                children=dcc.Graph(id="correlation-graph"),
+            ),
+            dcc.Loading(
+                className="graph-wrapper",
+                children=dcc.Graph(id="correlation-detail-graph"),
             ),
         ],
     )
@@ -348,10 +830,13 @@ def full_layout():
     )
 
 
-# By not calling full_layout (i.e. no ()), we reload it whenever the browser is refreshed,
-# this will then redo the SQL queries for the min & max dates, hence allowing for a dynamic database
+# By not calling full_layout (i.e. no ()), it can be reloaded when the browser is refreshed,
+# this will then redo the SQL query for the min & max dates, hence allowing for a dynamic database
 # See: https://dash.plotly.com/live-updates
+# It is only rebuilt & re-serialized when the data version moves though, otherwise the browser
+# gets the cached layout or just a 304 if it already has it
 app.layout = full_layout
+layout_cache.cache_layout(app, version=get_data_version)
 
 
 ### Panel callbacks ###
@@ -365,22 +850,34 @@ app.layout = full_layout
     [
         Input("date-picker-range", "start_date"),
         Input("date-picker-range", "end_date"),
+        Input("dropdown-select-uid", "search_value"),
     ],
+    [State("dropdown-select-uid", "value")],
 )
-def update_uid_dropdown(start_date, end_date):
-    """Update the UIDs available in the dropdown based on date range"""
-
-    # Get df of selected dates
-    uids = (
-        EXECUTOR.query_to_df(filter_date_query % (DATASET_NAME, start_date, end_date))
-        .uid.unique()
-        .tolist()
-    )
-    options = [{"label": i.strip("uid://"), "value": i} for i in uids]
+def update_uid_dropdown(start_date, end_date, search_value, current_uid):
+    """Update the UIDs available in the dropdown based on date range & search"""
+
+    index = get_uid_index(start_date, end_date)
+
+    # Typing in the dropdown only sends the best matches instead of all UIDs
+    ctx = dash.callback_context
+    if ctx.triggered[0]["prop_id"].split(".")[0] == "dropdown-select-uid":
+        return (
+            dash.no_update,
+            search.with_selected(index.search(search_value, MAX_OPTIONS), index, [current_uid]),
+        )
+
+    # The newest UID is listed first & gets selected, the ones after it are the most likely next picks
+    uids = [i["value"] for i in index.options]
+    for uid in uids[:PREFETCH_UIDS]:
+        PREFETCHER.submit(("uid", uid), warm_uid, uid)
+    # The deviation graph needs the reference spectra
+    if PREFETCH_REFERENCES and REFERENCES.stamp is None:
+        PREFETCHER.submit(("references",), update_references)
 
     return (
-        options[-1]["value"],
-        options,
+        uids[0],
+        index.search("", MAX_OPTIONS),
     )
 
 
@@ -397,10 +894,7 @@ def update_uid_dropdown(start_date, end_date):
 def update_antenna_dropdown(uid, antenna_select_all):
     """Update the antennas available in the dropdown"""
 
-    # Get df of currently selected UID
-    df = EXECUTOR.query_to_df(uid_subset_query % (DATASET_NAME, uid))
-
-    antennas = df.loc[df.uid == uid, "antennaname"].unique().tolist()
+    antennas = get_catalog_entry(uid)["antennas"]
     options = [{"label": i, "value": i} for i in antennas]
 
     # Check if the callback was triggered by the select-all button
@@ -436,7 +930,7 @@ def update_baseband_dropdown(uid, antennas, baseband_select_all):
     """Update the basebands available in the dropdown"""
 
     # Get df of currently selected UID
-    df = EXECUTOR.query_to_df(uid_subset_query % (DATASET_NAME, uid))
+    df = get_uid_df(uid)
 
     basebands = (
         df.loc[(df.uid == uid) & (df.antennaname.isin(antennas)), "basebandname"].unique().tolist()
@@ -473,46 +967,54 @@ def update_baseband_dropdown(uid, antennas, baseband_select_all):
         Input("baseband-select", "value"),
         Input("scan-select-all", "value"),
         Input("summary-graph", "selectedData"),
+        Input("scan-select", "search_value"),
     ],
+    [State("scan-select", "value")],
 )
-def update_scan_dropdown(uid, antennas, basebands, scan_select_all, summary_selected):
+def update_scan_dropdown(
+    uid, antennas, basebands, scan_select_all, summary_selected, search_value, current_scans
+):
     """Update the Scans available in the dropdown"""
 
     # If rectangle/lasso select has been used to select points from the upper graph, subselect
     if summary_selected:
-        # caldataid is the last custom data we present (via hover in the summary graph)
-        scans = set(sub_dict["customdata"][-1] for sub_dict in summary_selected["points"])
+        scans = get_selected_rows(uid, summary_selected).caldataid.unique().tolist()
+        index = search.OptionIndex([{"label": i, "value": i} for i in scans])
     else:
-        # Get df of currently selected UID
-        df = EXECUTOR.query_to_df(uid_subset_query % (DATASET_NAME, uid))
-
-        # Note that scans == caldataid ~= startvalidtime
-        scans = (
-            df.loc[
-                (df.uid == uid)
-                & (df.antennaname.isin(antennas))
-                & (df.basebandname.isin(basebands)),
-                "caldataid",
-            ]
-            .unique()
-            .tolist()
-        )
-
-    options = [{"label": i, "value": i} for i in scans]
+        index = get_scan_index(uid, antennas, basebands)
 
     # Check if the callback was triggered by the select-all button
     # See: https://dash.plotly.com/advanced-callbacks
     ctx = dash.callback_context
-    if ctx.triggered[0]["prop_id"].split(".")[0] == "scan-select-all":
+    trigger = ctx.triggered[0]["prop_id"].split(".")[0]
+    # Typing in the dropdown only sends the best matches instead of all scans
+    if trigger == "scan-select":
+        return (
+            dash.no_update,
+            search.with_selected(index.search(search_value, MAX_OPTIONS), index, current_scans),
+        )
+
+    # Decode the first scans in the background, the AoD usually looks at those next
+    first_scans = [i["value"] for i in index.options[:PREFETCH_SCANS]]
+    PREFETCHER.submit(("scans", uid, tuple(first_scans)), warm_scans, uid, first_scans)
+
+    if trigger == "scan-select-all":
         if scan_select_all == ["All"]:
-            value = [i["value"] for i in options]
+            value = [i["value"] for i in index.options]
         else:
             value = dash.no_update
-    elif ctx.triggered[0]["prop_id"].split(".")[0] == "summary-graph":
-        value = [i["value"] for i in options]
+    elif trigger == "summary-graph":
+        value = [i["value"] for i in index.options]
     # Otherwise it can only be due to a change in UID/Antenna - In that case also select the first by default
     else:
-        value = [i["value"] for i in options[:1]]
+        value = [i["value"] for i in index.options[:1]]
+
+    # Only a page of options is sent, plus the ones of the selected scans so they can be displayed
+    options = index.search("", MAX_OPTIONS)
+    if value is not dash.no_update:
+        options = search.with_selected(options, index, value)
+    elif current_scans:
+        options = search.with_selected(options, index, current_scans)
 
     return (
         value,
@@ -543,8 +1045,21 @@ def update_summary_graph(
     graph_type,
 ):
     """Creates facet graph based on UID, Antenna & BBand selection"""
+    return get_summary_figure(uid, antennas, basebands, graph_type)
+
+
+def get_summary_figure(uid, antennas, basebands, graph_type):
+    """Get the summary figure from the cache, building it on a miss"""
+    key = (uid, tuple(antennas), tuple(basebands), graph_type)
+    return SUMMARY_FIGURE_CACHE.get_or_compute(
+        key, lambda: build_summary_figure(uid, antennas, basebands, graph_type)
+    )
+
+
+def build_summary_figure(uid, antennas, basebands, graph_type):
+    """Facet figure of the summary variables of a UID"""
     # Get df of currently selected UID
-    df = EXECUTOR.query_to_df(uid_subset_query % (DATASET_NAME, uid))
+    df = get_uid_df(uid)
 
     graph_df = df.loc[
         (df.uid == uid) & (df.antennaname.isin(antennas)) & (df.basebandname.isin(basebands))
@@ -563,39 +1078,93 @@ def update_summary_graph(
     var_label = "Polarization" if value_label == "Temperature" else "Variable"
     add_labels = {"value": value_label, "variable": var_label}
 
-    fig = px.scatter(
+    # The row id always comes first in the custom data, selections are resolved with it
+    if LEAN_FIGURES:
+        hover_kwargs = dict(custom_data=["rowid"])
+    else:
+        hover_kwargs = dict(
+            hover_name="antennaname",
+            hover_data={
+                "frequency_mid": ":.2f",
+                "startvalidtime": False,
+                "caldataid": True,
+                "value": ":.2f [K]",
+            },
+            custom_data=["rowid", "frequency_mid"],
+        )
+
+    # Same figure as px.scatter would give, without its reshaping & validation overhead
+    fig = scatter.scatter(
         graph_df,
         x=x,
         y=y,
         facet_col="basebandname",
         facet_col_wrap=2,
         labels={**add_labels, **GRAPH_LABELS},
-        render_mode="webgl",
-        hover_name="antennaname",
-        hover_data={
-            "frequency_mid": ":.2f",
-            "startvalidtime": False,
-            "caldataid": True,
-            "value": ":.2f [K]",
-        },
-        custom_data=["frequency_mid"],
         template="plotly_dark",
+        **hover_kwargs,
     )
 
-    fig.update_yaxes(rangemode="tozero")
+    # The remaining details are shown below the graph, see update_summary_hover
+    if LEAN_FIGURES:
+        for trace in fig["data"]:
+            trace["hovertemplate"] = "%{y:.2f}<extra></extra>"
 
     # Make it transparent, drawings via the drawing tool in cyan & box-select as default tool
-    fig.update_layout(
-        transparent_layout, newshape=dict(line=dict(color="cyan", width=5)), dragmode="select"
+    fig["layout"].update(
+        transparent_layout.to_plotly_json(),
+        newshape=dict(line=dict(color="cyan", width=5)),
+        dragmode="select",
     )
-    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor="White")
-    fig.update_yaxes(showgrid=True, rangemode="tozero", gridwidth=1, gridcolor="White")
+    scatter.update_axes(fig, "x", showgrid=True, gridwidth=1, gridcolor="White")
+    scatter.update_axes(fig, "y", showgrid=True, rangemode="tozero", gridwidth=1, gridcolor="White")
 
     return fig
 
 
 @app.callback(
-    Output("spectrum-graph", "figure"),
+    Output("summary-hover-details", "children"),
+    [Input("summary-graph", "hoverData")],
+    [
+        State("dropdown-select-uid", "value"),
+        State("dropdown-select-summary-graph", "value"),
+    ],
+)
+def update_summary_hover(hover_data, uid, graph_type):
+    """Look up the details of the hovered summary point via its row id"""
+    # Full figures show the details in their tooltips already
+    if not LEAN_FIGURES or not hover_data:
+        return ""
+
+    rows = get_rows(uid, [point["customdata"][0] for point in hover_data["points"]])
+    if len(rows) == 0:
+        return ""
+    row = rows.iloc[0]
+
+    details = [
+        ("Antenna", row.antennaname),
+        ("BaseBand", row.basebandname),
+        ("Scan", row.caldataid),
+        ("Scan Timestamp", row.startvalidtime),
+        ("Frequency Mid (GHz)", "{:.2f}".format(row.frequency_mid * 1e-9)),
+    ] + [
+        (GRAPH_LABELS.get(col, col), "{:.2f}".format(row[col])) for col in graph_type.split(",")[1:]
+    ]
+
+    return " | ".join("{}: {}".format(label, value) for label, value in details)
+
+
+EMPTY_SPECTRUM_FIGURE = {
+    "data": [],
+    "layout": transparent_layout,
+}
+
+
+@app.callback(
+    [
+        Output("spectrum-graph-ops", "data"),
+        Output("spectrum-graph-state", "data"),
+    ],
     [
         Input("dropdown-select-uid", "value"),
         Input("antenna-select", "value"),
@@ -603,7 +1172,9 @@ def update_summary_graph(
         Input("scan-select", "value"),
         Input("summary-graph", "selectedData"),
         Input("dropdown-select-summary-graph", "value"),
+        Input("dropdown-select-spectrum-graph", "value"),
     ],
+    [State("spectrum-graph-state", "data")],
 )
 def update_spectrum_graph(
     uid,
@@ -612,22 +1183,113 @@ def update_spectrum_graph(
     scans,
     summary_selected,
     summary_graph_type,
+    spectrum_graph_type,
+    shown,
 ):
-    """Creates scatter plot based on UID, Antenna, BBand, Scan & Summary graph selection"""
-    # Get df of currently selected UID
-    df = EXECUTOR.query_to_df(uid_subset_query % (DATASET_NAME, uid))
-    # Get X Variable
-    x = "frequencyspectrum"
+    """Creates scatter plot based on UID, Antenna, BBand, Scan & Summary graph selection
+
+    Returns operations on the spectrum graph, which are applied in the browser, & what it shows.
+    If only the scans changed, the traces of removed scans are dropped & only the added scans are
+    sent, otherwise the whole figure is replaced.
+    """
+    scans = scans or []
+    state = {
+        "key": [uid, antennas, basebands, summary_graph_type, spectrum_graph_type],
+        "scans": None,
+    }
+
     # Get Y Variable(s)
     y_summary = summary_graph_type.split(",")[1:]
     # Check if valid selection for plotting lower graph
     if not (set(y_summary) <= set(SUMMARY_SPECTRUM_MAP.keys())):
-        return {
-            "data": [],
-            "layout": transparent_layout,
-        }
+        return {"figure": EMPTY_SPECTRUM_FIGURE}, state
 
     y_spectrum = [SUMMARY_SPECTRUM_MAP[y_str] for y_str in y_summary]
+    value_label = "Deviation (K)" if spectrum_graph_type == "deviation" else "Temperature"
+
+    # Only the scans changed & the graph shows one set of traces per scan, so update incrementally
+    ctx = dash.callback_context
+    triggers = set(trigger["prop_id"] for trigger in ctx.triggered)
+    if (
+        triggers == {"scan-select.value"}
+        and scans
+        and shown
+        and shown["scans"] is not None
+        and shown["key"] == state["key"]
+    ):
+        added = [scan for scan in scans if scan not in shown["scans"]]
+        removed = [scan for scan in shown["scans"] if scan not in scans]
+        graph_df = get_spectrum_graph_df(uid, antennas, basebands, added, summary_selected)
+        if spectrum_graph_type == "deviation" and len(graph_df):
+            graph_df = with_residuals(uid, graph_df, y_spectrum)
+        traces = (
+            build_spectrum_traces(graph_df, y_spectrum, value_label)[0] if len(graph_df) else []
+        )
+        state["scans"] = scans
+        return {"remove": removed, "append": traces}, state
+
+    graph_df = get_spectrum_graph_df(uid, antennas, basebands, scans, summary_selected)
+    if len(graph_df) == 0:
+        return {"figure": EMPTY_SPECTRUM_FIGURE}, state
+
+    if spectrum_graph_type == "waterfall":
+        return {"figure": build_waterfall_figure(graph_df, y_spectrum)}, state
+
+    if spectrum_graph_type == "deviation":
+        graph_df = with_residuals(uid, graph_df, y_spectrum)
+
+    traces, layout = build_spectrum_traces(graph_df, y_spectrum, value_label)
+    fig = {"data": traces, "layout": layout}
+
+    # Make it transparent & drawings via the drawing tool in cyan
+    fig["layout"].update(
+        transparent_layout.to_plotly_json(),
+        newshape=dict(line=dict(color="cyan", width=5)),
+    )
+    scatter.update_axes(fig, "x", showgrid=True, gridwidth=1, gridcolor="White")
+    scatter.update_axes(fig, "y", showgrid=True, rangemode="tozero", gridwidth=1, gridcolor="White")
+
+    state["scans"] = scans
+    return {"figure": fig}, state
+
+
+# Applies the operations of update_spectrum_graph to the figure already in the browser, so adding
+# a scan only sends its own traces. Only the first trace of every polarization is in the legend.
+# See: https://dash.plotly.com/clientside-callbacks
+app.clientside_callback(
+    """
+    function(ops, figure) {
+        if (!ops) {
+            return window.dash_clientside.no_update;
+        }
+        if (ops.figure) {
+            return ops.figure;
+        }
+        var data = figure.data
+            .filter(function(trace) { return ops.remove.indexOf(trace.meta) < 0; })
+            .concat(ops.append);
+        var inLegend = {};
+        data = data.map(function(trace) {
+            var showlegend = !inLegend[trace.legendgroup];
+            inLegend[trace.legendgroup] = true;
+            return Object.assign({}, trace, {showlegend: showlegend});
+        });
+        return Object.assign({}, figure, {data: data});
+    }
+    """,
+    Output("spectrum-graph", "figure"),
+    [Input("spectrum-graph-ops", "data")],
+    [State("spectrum-graph", "figure")],
+)
+
+
+def get_spectrum_graph_df(uid, antennas, basebands, scans, summary_selected):
+    """Rows of the given scans with decoded spectra, subselected like the summary graph"""
+    # Get the already decoded spectra of the selected scans of the current UID
+    scan_spectra = get_scan_spectra(uid, scans)
+    if not scan_spectra:
+        return pd.DataFrame()
+    df = pd.concat(scan_spectra.values(), ignore_index=True)
 
     # Drop the index so lateron no pandas copy warning is raised
     graph_df = df.loc[
@@ -637,6 +1299,21 @@ def update_spectrum_graph(
         & (df.caldataid.isin(scans))
     ].reset_index(drop=True)
 
+    # If rectangle/lasso select has been used to select points from the upper graph, subselect
+    if summary_selected:
+        selected_rows = get_selected_rows(uid, summary_selected)
+        graph_df = graph_df.loc[graph_df.rowid.isin(selected_rows.rowid)]
+
+    return graph_df
+
+
+def build_spectrum_traces(graph_df, y_spectrum, value_label="Temperature"):
+    """Scatter traces of the exploded spectra, one per scan & polarization, & their layout
+
+    Every trace carries its scan as meta, so the browser can drop the traces of a scan again.
+    """
+    # Get X Variable
+    x = "frequencyspectrum"
     explode_cols = [x] + y_spectrum
     add_cols = [
         "antennaname",
@@ -644,78 +1321,288 @@ def update_spectrum_graph(
         "caldataid",
     ]
 
-    # If rectangle/lasso select has been used to select points from the upper graph, subselect
-    if summary_selected:
-        # Select caldataid as the x-axis representative as startvalidtime has formatting changes
-        x_selected = set(sub_dict["customdata"][-1] for sub_dict in summary_selected["points"])
-        y_selected = set(sub_dict["y"] for sub_dict in summary_selected["points"])
-
-        # Filter df according to selection
-        graph_df = graph_df.loc[
-            (graph_df.caldataid.isin(x_selected))
-            & (graph_df[y_summary[0]].isin(y_selected) | graph_df[y_summary[-1]].isin(y_selected))
-        ]
-
-    graph_df.loc[:, explode_cols] = graph_df.loc[:, explode_cols].applymap(
-        lambda arr: np.array(arr.split(",")[5:-5]).astype(float)
+    traces, layout = [], None
+    for scan, scan_df in graph_df.groupby("caldataid", sort=False):
+        # Explode the spectra into one point per channel by concatenating the arrays directly,
+        # repeating the per-row columns to match
+        lengths = scan_df[x].map(len).to_numpy()
+        columns = {col: np.concatenate(scan_df[col].to_numpy()) for col in explode_cols}
+        columns.update({col: np.repeat(scan_df[col].to_numpy(), lengths) for col in add_cols})
+
+        # Turn into GHz
+        if x == "frequencyspectrum":
+            columns["frequencyspectrum"] = columns["frequencyspectrum"] * 1e-9
+
+        fig = scatter.scatter(
+            columns,
+            x=x,
+            y=y_spectrum,
+            labels={"variable": "Polarization", "value": value_label, **GRAPH_LABELS},
+            template="plotly_dark",
+            hover_data={col: True for col in add_cols},
+        )
+        for trace in fig["data"]:
+            trace["meta"] = int(scan)
+            trace["showlegend"] = not traces
+        traces += fig["data"]
+        layout = fig["layout"]
+
+    return traces, layout
+
+
+def build_waterfall_figure(graph_df, y_spectrum):
+    """Heatmaps of the mean temperature per scan & frequency bin, one per baseband
+
+    Every antenna gets its own block of rows in the heatmaps, so e.g. one hot antenna is not
+    averaged away by all the others.
+    """
+    # Rows of the image follow the scans in time
+    scan_order = graph_df.groupby("caldataid").startvalidtime.min().sort_values().index
+    scan_positions = scan_order.get_indexer(graph_df.caldataid)
+    antennas = pd.Index(graph_df.antennaname.unique())
+    basebands = sorted(graph_df.basebandname.unique())
+
+    # Fewer scan rows per antenna the more antennas are shown
+    scan_bins = int(
+        np.clip(
+            WATERFALL_PIXELS // (len(antennas) * WATERFALL_FREQUENCY_BINS), 1, WATERFALL_SCAN_BINS
+        )
     )
 
-    # graph_df = graph_df.explode(explode_cols)
-    # For older pandas v's, we must explode each column individually & deduplicate (DSS is still uses older pandas)
-    graph_df = pd.concat([graph_df[[col] + add_cols].explode(col) for col in explode_cols], axis=1)
-    graph_df = graph_df.loc[:, ~graph_df.columns.duplicated()]
+    traces, layout = [], {}
+    domains = np.linspace(0, 1, len(basebands) + 1)
+    for i, baseband in enumerate(basebands):
+        rows = (graph_df.basebandname == baseband).to_numpy()
+        baseband_df = graph_df.loc[rows]
+        # Both polarizations go into the same bins
+        image, frequencies, row_starts = spectra.waterfall_image(
+            list(baseband_df.frequencyspectrum) * len(y_spectrum),
+            sum([list(baseband_df[col]) for col in y_spectrum], []),
+            np.tile(scan_positions[rows], len(y_spectrum)),
+            len(scan_order),
+            scan_bins=scan_bins,
+            frequency_bins=WATERFALL_FREQUENCY_BINS // len(basebands),
+            groups=np.tile(antennas.get_indexer(baseband_df.antennaname), len(y_spectrum)),
+            n_groups=len(antennas),
+        )
 
-    # Turn into GHz
-    if x == "frequencyspectrum":
-        graph_df["frequencyspectrum"] = graph_df["frequencyspectrum"] * 1e-9
+        suffix = "" if i == 0 else str(i + 1)
+        traces.append(
+            {
+                "type": "heatmap",
+                "z": image.astype(np.float32),
+                "x": frequencies * 1e-9,
+                "y": [
+                    "%s %s" % (antenna, scan)
+                    for antenna in antennas
+                    for scan in scan_order[row_starts]
+                ],
+                "xaxis": "x" + suffix,
+                "coloraxis": "coloraxis",
+                "hoverongaps": False,
+                "hovertemplate": "Baseband=%s<br>Frequency (GHz)=%%{x:.4f}<br>"
+                "Antenna & Scan=%%{y}<br>Temperature=%%{z:.2f}<extra></extra>" % baseband,
+            }
+        )
+        layout["xaxis" + suffix] = {
+            "anchor": "y",
+            "domain": [domains[i] + (0.01 if i else 0), domains[i + 1] - 0.01],
+            "title": {"text": "%s %s" % (baseband, GRAPH_LABELS["frequencyspectrum"])},
+        }
 
-    fig = px.scatter(
-        graph_df,
-        x=x,
-        y=y_spectrum,
-        labels={"variable": "Polarization", "value": "Temperature", **GRAPH_LABELS},
-        render_mode="webgl",
-        template="plotly_dark",
-        hover_data={col: True for col in add_cols},
-    )
+    fig = {"data": traces, "layout": {"template": scatter.get_template("plotly_dark")}}
 
     # Make it transparent & drawings via the drawing tool in cyan
-    fig.update_layout(
-        transparent_layout,
+    fig["layout"].update(
+        transparent_layout.to_plotly_json(),
         newshape=dict(line=dict(color="cyan", width=5)),
+        yaxis={"title": {"text": "Antenna & Scan"}, "type": "category"},
+        coloraxis={"colorscale": "Viridis", "colorbar": {"title": {"text": "Temperature"}}},
+        **layout,
     )
-    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor="White")
-    fig.update_yaxes(showgrid=True, rangemode="tozero", gridwidth=1, gridcolor="White")
 
     return fig
 
 
-# Prevent from being called when the app is loaded via prevent_initial_call
 @app.callback(
-    Output("download", "data"),
-    [Input("btn", "n_clicks")],
+    [
+        Output("correlation-baseband", "options"),
+        Output("correlation-baseband", "value"),
+        Output("correlation-scan", "options"),
+        Output("correlation-scan", "value"),
+    ],
+    [
+        Input("baseband-select", "value"),
+        Input("scan-select", "value"),
+    ],
+    [
+        State("correlation-baseband", "value"),
+        State("correlation-scan", "value"),
+    ],
+)
+def update_correlation_controls(basebands, scans, current_baseband, current_scan):
+    """Offer the selected basebands & scans, keeping the current ones while still selected"""
+    basebands, scans = basebands or [], scans or []
+    baseband = current_baseband if current_baseband in basebands else next(iter(basebands), None)
+    scan = current_scan if current_scan in scans else next(iter(scans), None)
+    return (
+        [{"label": i, "value": i} for i in basebands],
+        baseband,
+        [{"label": i, "value": i} for i in scans],
+        scan,
+    )
+
+
+def get_spectrum_columns(summary_graph_type):
+    """Spectrum columns of the y variables of a summary graph type, None if it has none"""
+    y_summary = summary_graph_type.split(",")[1:]
+    if not (set(y_summary) <= set(SUMMARY_SPECTRUM_MAP.keys())):
+        return None
+    return [SUMMARY_SPECTRUM_MAP[y_str] for y_str in y_summary]
+
+
+@app.callback(
+    Output("correlation-graph", "figure"),
+    [
+        Input("dropdown-select-uid", "value"),
+        Input("antenna-select", "value"),
+        Input("correlation-baseband", "value"),
+        Input("correlation-scan", "value"),
+        Input("dropdown-select-summary-graph", "value"),
+        Input("correlation-metric", "value"),
+    ],
+)
+def update_correlation_graph(uid, antennas, baseband, scan, summary_graph_type, metric):
+    """Heatmap of the selected antennas against each other for one scan & baseband"""
+    columns = get_spectrum_columns(summary_graph_type)
+    if not columns or baseband is None or scan is None:
+        return {"data": [], "layout": transparent_layout}
+
+    matrix_antennas, matrix = get_antenna_matrix(uid, baseband, scan, columns, metric)
+    # Subselect the cached matrix instead of recomputing it for every antenna selection
+    keep = [i for i, antenna in enumerate(matrix_antennas) if antenna in (antennas or [])]
+    if not keep:
+        return {"data": [], "layout": transparent_layout}
+    names = [matrix_antennas[i] for i in keep]
+    matrix = matrix[np.ix_(keep, keep)]
+
+    label = "Correlation" if metric == "correlation" else "RMS Distance (K)"
+    heatmap = {
+        "type": "heatmap",
+        "z": matrix,
+        "x": names,
+        "y": names,
+        "colorscale": "Viridis",
+        "colorbar": {"title": {"text": label}},
+        "hovertemplate": "%{x} vs %{y}<br>" + label + "=%{z:.3f}<extra></extra>",
+    }
+    # An antenna unlike the others shows up as a dark cross for correlations
+    if metric == "correlation":
+        heatmap.update(zmin=-1, zmax=1)
+
+    fig = {"data": [heatmap], "layout": {"template": scatter.get_template("plotly_dark")}}
+    fig["layout"].update(
+        transparent_layout.to_plotly_json(),
+        title={"text": "BaseBand {}, Scan {} - click a cell to compare".format(baseband, scan)},
+        xaxis={"type": "category"},
+        yaxis={"type": "category", "autorange": "reversed"},
+    )
+    return fig
+
+
+@app.callback(
+    Output("correlation-detail-graph", "figure"),
+    [Input("correlation-graph", "clickData")],
     [
         State("dropdown-select-uid", "value"),
-        State("antenna-select", "value"),
-        State("baseband-select", "value"),
-        State("scan-select", "value"),
+        State("correlation-baseband", "value"),
+        State("correlation-scan", "value"),
+        State("dropdown-select-summary-graph", "value"),
     ],
     prevent_initial_call=True,
 )
-def generate_csv(
-    n_nlicks,
-    uid,
-    antennas,
-    basebands,
-    scans,
-):
-    # Get df of currently selected UID
-    df = EXECUTOR.query_to_df(uid_subset_query % (DATASET_NAME, uid))
+def update_correlation_detail(click_data, uid, baseband, scan, summary_graph_type):
+    """The spectra of the two antennas of a clicked cell, side by side"""
+    columns = get_spectrum_columns(summary_graph_type)
+    if not click_data or not columns:
+        return {"data": [], "layout": transparent_layout}
+    point = click_data["points"][0]
+    pair = [point["y"], point["x"]]
+
+    scan_df = get_scan_spectra(uid, [scan]).get(scan)
+    if scan_df is None:
+        return {"data": [], "layout": transparent_layout}
+    pair_df = scan_df.loc[(scan_df.basebandname == baseband) & scan_df.antennaname.isin(pair)]
 
-    out_df = df.loc[
-        (df.uid == uid)
-        & (df.antennaname.isin(antennas))
-        & (df.basebandname.isin(basebands))
-        & (df.caldataid.isin(scans))
-    ]
-    return dcc.send_data_frame(out_df.to_csv, filename="qa0_{}.csv".format(uid.strip("uid://")))
+    x = "frequencyspectrum"
+    lengths = pair_df[x].map(len).to_numpy()
+    data = {col: np.concatenate(pair_df[col].to_numpy()) for col in [x] + columns}
+    data["antennaname"] = np.repeat(pair_df.antennaname.to_numpy(), lengths)
+    # Turn into GHz
+    data[x] = data[x] * 1e-9
+
+    fig = scatter.scatter(
+        data,
+        x=x,
+        y=columns,
+        facet_col="antennaname",
+        labels={"variable": "Polarization", "value": "Temperature", **GRAPH_LABELS},
+        template="plotly_dark",
+    )
+    fig["layout"].update(
+        transparent_layout.to_plotly_json(),
+        newshape=dict(line=dict(color="cyan", width=5)),
+    )
+    scatter.update_axes(fig, "x", showgrid=True, gridwidth=1, gridcolor="White")
+    scatter.update_axes(fig, "y", showgrid=True, rangemode="tozero", gridwidth=1, gridcolor="White")
+    return fig
+
+
+@app.callback(
+    Output("csv-selection", "value"),
+    [
+        Input("dropdown-select-uid", "value"),
+        Input("antenna-select", "value"),
+        Input("baseband-select", "value"),
+        Input("scan-select", "value"),
+    ],
+)
+def update_csv_selection(uid, antennas, basebands, scans):
+    """Selection the download form posts"""
+    return json.dumps({"uid": uid, "antennas": antennas, "basebands": basebands, "scans": scans})
+
+
+def generate_csv(uid, antennas, basebands, scans):
+    """CSV of the selected rows of a UID, a batch of rows per chunk"""
+    header = True
+    for df in iter_uid_frames(uid):
+        out_df = df.loc[
+            (df.uid == uid)
+            & (df.antennaname.isin(antennas))
+            & (df.basebandname.isin(basebands))
+            & (df.caldataid.isin(scans))
+        ].drop(columns="rowid", errors="ignore")
+        # Only export the columns of the database, not the decoded spectra of the disk cache
+        out_df = out_df.loc[:, ~out_df.columns.str.endswith(spectra.DECODED_SUFFIX)]
+        yield out_df.to_csv(header=header)
+        header = False
+
+
+# A Dash callback would have to send the whole CSV in its response, so the CSV is streamed to the
+# browser from a route instead
+@app.server.route(app.config.routes_pathname_prefix + CSV_ROUTE, methods=["POST"])
+def download_csv():
+    selection = json.loads(flask.request.form["selection"])
+    return flask.Response(
+        flask.stream_with_context(generate_csv(**selection)),
+        mimetype="text/csv",
+        headers={
+            "Content-Disposition": "attachment; filename=qa0_{}.csv".format(
+                selection["uid"].strip("uid://")
+            )
+        },
+    )
+
+
+# Start polling for new observations once all callbacks are defined
+WATCHER.start()
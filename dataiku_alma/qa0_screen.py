@@ -0,0 +1,178 @@
+### Screens every UID of a date range from the command line, without clicking through the app ###
+# Run from this folder within DSS, e.g.: python qa0_screen.py --start 2021-08-01 --out reports
+# Outside of DSS, --synthetic N screens N generated UIDs instead of the database
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+import plotly.graph_objs as go
+
+import utils.queries as queries
+import utils.screening as screening
+import utils.streaming as streaming
+import utils.synthetic as synthetic
+
+SUMMARY_FILE = "screen_summary.csv"
+SUMMARY_COLUMNS = ["uid", "n_antennas", "n_flagged", "flagged", "seconds", "error"]
+
+# Set per worker process, executors can't be shared between processes
+EXECUTOR = None
+
+
+def get_executor(synthetic_df=None):
+    if synthetic_df is not None:
+        return synthetic.SQLiteExecutor(synthetic_df, queries.DATASET_NAME)
+    # Only exists within DSS
+    from dataiku import SQLExecutor2
+
+    return SQLExecutor2(dataset="raw_cal_joined")
+
+
+def init_worker(synthetic_df=None):
+    global EXECUTOR
+    EXECUTOR = get_executor(synthetic_df)
+
+
+def report_name(uid):
+    return uid.replace("uid://", "").replace("/", "_")
+
+
+def anomaly_figure(report):
+    """Heatmap of the largest |z| per antenna & baseband"""
+    matrix = report.pivot(index="antennaname", columns="basebandname", values="max_abs_z")
+    return go.Figure(
+        go.Heatmap(
+            z=matrix.to_numpy(),
+            x=matrix.columns.tolist(),
+            y=matrix.index.tolist(),
+            colorscale="Viridis",
+            colorbar={"title": {"text": "max |z|"}},
+        ),
+        layout={
+            "title": {"text": report.uid.iloc[0]},
+            "template": "plotly_dark",
+            "height": max(400, 15 * len(matrix)),
+        },
+    )
+
+
+def screen_uid(uid, out, file_format, images, threshold):
+    """Screen one UID & write its report, returns a summary row
+
+    Errors only fail their own UID, they are recorded in the error column of its row.
+    """
+    t_start = time.perf_counter()
+    try:
+        row = write_report(uid, out, file_format, images, threshold)
+    except Exception as error:
+        row = {
+            "uid": uid,
+            "n_antennas": 0,
+            "n_flagged": 0,
+            "flagged": "",
+            "error": "%s: %s" % (type(error).__name__, error),
+        }
+    row["seconds"] = round(time.perf_counter() - t_start, 2)
+    return row
+
+
+def write_report(uid, out, file_format, images, threshold):
+    """Screen one UID & write its report, returns its summary row without timing"""
+    query = queries.uid_subset_query % (queries.DATASET_NAME, uid)
+    report = screening.screen_frames(streaming.iter_frames(EXECUTOR, query), threshold)
+    if len(report) == 0:
+        return {"uid": uid, "n_antennas": 0, "n_flagged": 0, "flagged": ""}
+
+    path = os.path.join(out, report_name(uid))
+    if file_format == "parquet":
+        report.to_parquet(path + ".parquet", index=False)
+    else:
+        report.to_csv(path + ".csv", index=False)
+    if images:
+        anomaly_figure(report).write_image(path + ".png")
+
+    flagged = report.loc[report.anomalous]
+    return {
+        "uid": uid,
+        "n_antennas": report.antennaname.nunique(),
+        "n_flagged": flagged.antennaname.nunique(),
+        "flagged": " ".join(flagged.antennaname + "/" + flagged.basebandname),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen all UIDs of a date range for anomalies")
+    parser.add_argument("--start", required=True, help="First day, e.g. 2021-08-01")
+    parser.add_argument("--end", help="Last day, defaults to --start")
+    parser.add_argument("--out", default="qa0_reports", help="Folder for the reports")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument(
+        "--images", action="store_true", help="Also write a PNG per UID, needs kaleido"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes to use")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=screening.MAD_THRESHOLD,
+        help="Robust z-score beyond which antennas are flagged",
+    )
+    parser.add_argument(
+        "--synthetic", type=int, default=0, help="Screen this many synthetic UIDs instead"
+    )
+    args = parser.parse_args()
+
+    if args.images:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error("--images needs the kaleido package")
+
+    synthetic_df = None
+    if args.synthetic:
+        synthetic_df = synthetic.generate_dataset(n_uids=args.synthetic, start=args.start)
+
+    end = (args.end or args.start) + " 23:59:59"
+    uids = (
+        get_executor(synthetic_df)
+        .query_to_df(queries.filter_date_query % (queries.DATASET_NAME, args.start, end))
+        .uid.tolist()
+    )
+    os.makedirs(args.out, exist_ok=True)
+    print("Screening %d UIDs with %d workers" % (len(uids), args.workers))
+
+    screen = partial(
+        screen_uid,
+        out=args.out,
+        file_format=args.format,
+        images=args.images,
+        threshold=args.threshold,
+    )
+    rows = []
+    with ProcessPoolExecutor(
+        args.workers, initializer=init_worker, initargs=(synthetic_df,)
+    ) as pool:
+        for row in pool.map(screen, uids):
+            if row.get("error"):
+                print("%s: failed, %s" % (row["uid"], row["error"]))
+            else:
+                print(
+                    "%s: %d of %d antennas flagged"
+                    % (row["uid"], row["n_flagged"], row["n_antennas"])
+                )
+            rows.append(row)
+
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    summary.to_csv(os.path.join(args.out, SUMMARY_FILE), index=False)
+    n_failed = summary.error.notna().sum()
+    print("Wrote %d reports to %s, %d UIDs failed" % (len(rows) - n_failed, args.out, n_failed))
+    if n_failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry once full
+
+    Full means more than maxsize entries or, with sizeof(value) giving the bytes of a value, more
+    than maxbytes in total. The newest entry is always kept, even if it alone exceeds maxbytes.
+    """
+
+    def __init__(self, maxsize=32, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        # Bytes per key & in total, only tracked with sizeof
+        self._sizes = {}
+        self._bytes = 0
+        # Futures of the values being computed, keyed like _data
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._remove(key)
+        self._data[key] = value
+        if self.sizeof is not None:
+            self._sizes[key] = self.sizeof(value)
+            self._bytes += self._sizes[key]
+        while len(self._data) > self.maxsize or (
+            self.maxbytes is not None and self._bytes > self.maxbytes and len(self._data) > 1
+        ):
+            self._remove(next(iter(self._data)))
+
+    def _remove(self, key, default=None):
+        self._bytes -= self._sizes.pop(key, 0)
+        return self._data.pop(key, default)
+
+    def pop(self, key, default=None):
+        """Remove key, a computation of it in flight is no longer stored when it finishes"""
+        with self._lock:
+            self._inflight.pop(key, None)
+            return self._remove(key, default)
+
+    def invalidate(self, match):
+        """Remove every entry & in-flight computation whose key satisfies match(key)"""
+        with self._lock:
+            for key in [key for key in self._data if match(key)]:
+                self._remove(key)
+            for key in [key for key in self._inflight if match(key)]:
+                del self._inflight[key]
+
+    def clear(self):
+        with self._lock:
+            self._inflight.clear()
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value, computing & storing it on a miss
+
+        Concurrent misses of the same key share one computation, e.g. a callback asking for a UID
+        that a prefetch job is already fetching waits for that fetch instead of starting another.
+        A computation whose key was popped or invalidated meanwhile returns its value to the callers
+        waiting for it, but does not store it, so stale values never overwrite fresh ones.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as error:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            future.set_exception(error)
+            raise
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+                self._store(key, value)
+        future.set_result(value)
+        return value
+
+
+class Prefetcher:
+    """Warms caches in background threads while the user is still reading the current view
+
+    At most `max_workers` jobs run at once & at most `max_pending` are queued, further jobs are
+    dropped. Jobs only start while no foreground callback is fetching data, so they never delay
+    the requests the user is actually waiting on. Jobs already running are not interrupted, a
+    callback needing the same entry joins their computation via LRUCache.get_or_compute.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._foreground = 0
+        # Set in the threads running jobs
+        self._local = threading.local()
+
+    @contextmanager
+    def foreground(self):
+        """Mark a user-facing fetch, queued prefetch jobs wait until it is done
+
+        Inside a prefetch job this does nothing, jobs calling the same helpers as the callbacks
+        would otherwise hold back each other.
+        """
+        if getattr(self._local, "in_job", False):
+            yield
+            return
+        with self._idle:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._foreground -= 1
+                if self._foreground == 0:
+                    self._idle.notify_all()
+
+    def submit(self, key, fn, *args):
+        """Queue fn(*args) unless a job with the same key is pending or the queue is full"""
+        with self._lock:
+            if key in self._pending or not self._slots.acquire(blocking=False):
+                return False
+            self._pending.add(key)
+        self._executor.submit(self._run, key, fn, args)
+        return True
+
+    def _run(self, key, fn, args):
+        try:
+            with self._idle:
+                self._idle.wait_for(lambda: self._foreground == 0)
+            self._local.in_job = True
+            fn(*args)
+        except Exception:
+            # A failed prefetch only means a cold cache later on, never break the app for it
+            logger.exception("Prefetch %s failed", key)
+        finally:
+            self._local.in_job = False
+            with self._lock:
+                self._pending.discard(key)
+            self._slots.release()
+
+
+class Watcher:
+    """Polls a stamp (e.g. the newest timestamp of a table) in a daemon thread
+
+    `on_change(old_stamp, new_stamp)` is called whenever the polled stamp changes. The first poll
+    only records the stamp.
+    """
+
+    def __init__(self, poll, on_change, interval=60):
+        self.poll = poll
+        self.on_change = on_change
+        self.interval = interval
+        self.stamp = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Poll once right away, so the stamp is known before anything is cached, then keep at it"""
+        if self._thread is None:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Watcher poll failed")
+            self._thread = threading.Thread(target=self._loop, name="watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        """Poll once, calling on_change if the stamp moved"""
+        with self._lock:
+            stamp = self.poll()
+            old_stamp, self.stamp = self.stamp, stamp
+            if old_stamp is not None and stamp != old_stamp:
+                self.on_change(old_stamp, stamp)
+
+    def _loop(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Watcher poll failed")
+            if self._stop.wait(self.interval):
+                return
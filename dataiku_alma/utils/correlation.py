@@ -0,0 +1,25 @@
+import numpy as np
+
+METRICS = ["correlation", "distance"]
+
+
+def stack_spectra(rows):
+    """Matrix with one row per list of spectra, e.g. both polarizations of an antenna
+
+    Rows whose spectra differ in length from the first row's are left out. Returns the matrix &
+    the positions of the rows it holds.
+    """
+    lengths = [tuple(len(arr) for arr in spectra) for spectra in rows]
+    keep = [i for i, length in enumerate(lengths) if length == lengths[0]]
+    return np.array([np.concatenate(rows[i]) for i in keep]), keep
+
+
+def pairwise_matrix(matrix, metric="correlation"):
+    """Correlation or RMS distance of every pair of rows, from one matrix product"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if metric == "correlation":
+            return np.corrcoef(matrix)
+        squared = (matrix**2).sum(axis=1)
+        distances = (squared[:, None] + squared[None, :] - 2 * matrix @ matrix.T) / matrix.shape[1]
+        # Rounding can leave tiny negatives on the diagonal
+        return np.sqrt(np.clip(distances, 0, None))
@@ -0,0 +1,134 @@
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+
+# The disk cache is optional, without pyarrow the app only caches in memory
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+AVAILABLE = pa is not None
+
+
+def _digest(value):
+    return hashlib.sha1(str(value).encode()).hexdigest()
+
+
+def _open_writer(file, schema, tables):
+    """IPC file writer with the given tables written already"""
+    writer = pa.ipc.new_file(file, schema)
+    for table in tables:
+        writer.write_table(table.cast(schema))
+    return writer
+
+
+class DiskCache:
+    """DataFrames stored as Arrow IPC files in a directory, keyed by key & version
+
+    Files are written under a temporary name & only renamed into place once they read back, so any
+    number of processes can share the directory. Arrow checks the footer of a file on opening it,
+    files that fail to open count as missing & are removed. Files are loaded memory-mapped & the
+    least recently used files are evicted once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=20e9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, version):
+        return os.path.join(self.directory, "%s-%s.arrow" % (_digest(key), _digest(version)))
+
+    def get(self, key, version):
+        """The stored DataFrame, or None if missing or unreadable"""
+        path = self._path(key, version)
+        try:
+            # Mark as recently used for the eviction
+            os.utime(path)
+            return pa.ipc.open_file(pa.memory_map(path)).read_all().to_pandas()
+        except FileNotFoundError:
+            return None
+        except (OSError, pa.ArrowInvalid):
+            logger.warning("Dropping unreadable cache file %s", path)
+            self._remove(path)
+            return None
+
+    def set(self, key, version, df):
+        """Store df, replacing any other version of key"""
+        self.set_frames(key, version, [df])
+
+    def set_frames(self, key, version, frames, valid=None):
+        """Store the DataFrames of an iterable as one, writing them a batch at a time
+
+        If given, valid() is called once all frames are written & the file is dropped unless it
+        returns True, e.g. because version got outdated meanwhile.
+        """
+        path = self._path(key, version)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                # The file needs its types upfront, so frames are held back while a column was
+                # only NULL so far & only then is the schema fixed, e.g. to string
+                held, schema, writer = [], None, None
+                for df in frames:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    if writer is not None:
+                        writer.write_table(table.cast(schema))
+                        continue
+                    held.append(table)
+                    schema = pa.unify_schemas([table.schema for table in held])
+                    if pa.null() not in schema.types:
+                        writer = _open_writer(file, schema, held)
+                        held = []
+                if writer is None:
+                    writer = _open_writer(file, schema or pa.schema([]), held)
+                writer.close()
+            # Raises if e.g. a full disk cut the file off, readers never see it then
+            pa.ipc.open_file(pa.memory_map(tmp_path))
+            if valid is not None and not valid():
+                return
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        for other in glob.glob(os.path.join(self.directory, _digest(key) + "-*.arrow")):
+            if other != path:
+                self._remove(other)
+        self.evict()
+
+    def pop(self, key):
+        """Remove all versions of key"""
+        for path in glob.glob(os.path.join(self.directory, _digest(key) + "-*.arrow")):
+            self._remove(path)
+
+    def evict(self):
+        """Remove the least recently used files until the directory fits into max_bytes"""
+        files = []
+        for path in glob.glob(os.path.join(self.directory, "*.arrow")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        # Another process may have removed it already, open memory maps stay valid
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,44 @@
+import hashlib
+import json
+import threading
+
+import flask
+import plotly
+
+
+def cache_layout(app, version=lambda: None):
+    """Serve the layout of a Dash app serialized once per version, with ETag support
+
+    Dash re-serializes (& re-builds, if the layout is a function) the whole layout on every page
+    load. Here it is only rebuilt when `version()` changes & browsers that already hold the current
+    layout get an empty 304 response.
+    See: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
+    """
+    cache = {}
+    # Requests are served from several threads, one builds the layout while the others wait
+    lock = threading.Lock()
+
+    @app.server.before_request
+    def serve_cached_layout():
+        if flask.request.path != app.config.routes_pathname_prefix + "_dash-layout":
+            return None
+
+        key = version()
+        with lock:
+            entry = cache.get(key)
+            if entry is None:
+                layout = app.layout() if callable(app.layout) else app.layout
+                body = json.dumps(layout, cls=plotly.utils.PlotlyJSONEncoder)
+                entry = (body, hashlib.md5(body.encode("utf-8")).hexdigest())
+                # Only the current version is ever served
+                cache.clear()
+                cache[key] = entry
+        body, etag = entry
+
+        response = flask.Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        # Browsers must revalidate, which is cheap as unchanged layouts only get a 304
+        response.cache_control.no_cache = True
+        return response.make_conditional(flask.request)
+
+    return serve_cached_layout
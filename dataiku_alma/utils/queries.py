@@ -0,0 +1,66 @@
+# SQL Queries of the QA0 app, shared with the command line screening
+
+# The joined table of alma_dss.sql
+DATASET_NAME = "TRENDANALYSISANDOUTLIERDETECTION_raw_cal_joined"
+
+# Quotes needed due to caps
+unique_uid_query = """
+SELECT DISTINCT uid
+FROM "%s"
+ORDER BY uid DESC
+"""
+
+# Somehow WHERE needs single quotes
+# Ordered by the key of a row, so its position is the same every time the UID is fetched
+uid_subset_query = """
+SELECT *
+FROM "%s"
+WHERE uid = '%s'
+ORDER BY caldataid, antennaname, basebandname
+"""
+
+uid_version_query = """
+SELECT MAX(startvalidtime), COUNT(*)
+FROM "%s"
+WHERE uid = '%s'
+"""
+
+# All good rows of the UIDs with rows after a timestamp
+reference_query = """
+SELECT uid, antennaname, basebandname, receiverband, startvalidtime,
+    frequencyspectrum, trecspectrum_x, trecspectrum_y, tsysspectrum_x, tsysspectrum_y
+FROM "%s"
+WHERE NOT is_outlier AND uid IN (
+    SELECT DISTINCT uid
+    FROM "%s"
+    WHERE startvalidtime > '%s'
+)
+ORDER BY startvalidtime
+"""
+
+min_date_query = """
+SELECT MIN(startvalidtime)
+FROM "%s"
+"""
+
+max_date_query = """
+SELECT MAX(startvalidtime)
+FROM "%s"
+"""
+
+date_range_query = """
+SELECT MIN(startvalidtime), MAX(startvalidtime)
+FROM "%s"
+"""
+
+filter_date_query = """
+SELECT DISTINCT uid
+FROM "%s"
+WHERE startvalidtime >= '%s' AND startvalidtime <= '%s'
+"""
+
+new_uids_query = """
+SELECT DISTINCT uid
+FROM "%s"
+WHERE startvalidtime > '%s'
+"""
@@ -0,0 +1,90 @@
+import threading
+import warnings
+from collections import deque
+
+import numpy as np
+
+
+class SpectrumAccumulator:
+    """Running mean of spectra on the frequency grid of the first one, fed a batch at a time"""
+
+    def __init__(self, frequency):
+        self.frequency = frequency
+        self.sums = {}
+        self.count = 0
+
+    def add(self, frequency, spectra):
+        """Add one spectrum per column, or stacks of them with one frequency row per spectrum"""
+        frequency = np.atleast_2d(frequency)
+        # Spectra of another tuning don't average with this one
+        if frequency.shape[1] != len(self.frequency):
+            return
+        rows = np.isclose(frequency, self.frequency).all(axis=1)
+        if not rows.any():
+            return
+        for column, values in spectra.items():
+            self.sums[column] = self.sums.get(column, 0) + np.atleast_2d(values)[rows].sum(axis=0)
+        self.count += int(rows.sum())
+
+    def means(self):
+        return {column: sums / self.count for column, sums in self.sums.items()}
+
+
+class ReferenceSpectra:
+    """Rolling median spectrum per key, e.g. antenna, baseband & receiverband
+
+    Every observation (UID) adds one mean spectrum per key & column, only the newest `window`
+    observations of each key are kept. Adding observations only touches their own keys.
+    """
+
+    def __init__(self, window=10):
+        self.window = window
+        # Newest timestamp of the added observations, later updates only need what came after it
+        self.stamp = None
+        self._history = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._history)
+
+    def add(self, uid, key, frequency, spectra, stamp=None):
+        """Add the mean spectra of a UID, replacing what it added before"""
+        # Interpolation needs increasing frequencies
+        if frequency[0] > frequency[-1]:
+            frequency = frequency[::-1]
+            spectra = {column: values[::-1] for column, values in spectra.items()}
+        with self._lock:
+            history = self._history.setdefault(key, deque(maxlen=self.window))
+            for entry in [entry for entry in history if entry[0] == uid]:
+                history.remove(entry)
+            history.append((uid, frequency, spectra))
+        if stamp is not None:
+            self.update_stamp(stamp)
+
+    def update_stamp(self, stamp):
+        """Record that everything up to stamp was added, e.g. after an update that found nothing"""
+        with self._lock:
+            if self.stamp is None or stamp > self.stamp:
+                self.stamp = stamp
+
+    def reference(self, key, column, frequency, exclude=None):
+        """Median over the history of key on the given frequencies, None without history
+
+        Observations of the UID `exclude` are left out, so a UID is not compared against itself.
+        Frequencies outside of an observation don't count towards the median.
+        """
+        with self._lock:
+            entries = [entry for entry in self._history.get(key, ()) if entry[0] != exclude]
+        if not entries:
+            return None
+        stack = np.array(
+            [
+                np.interp(frequency, entry_frequency, spectra[column], left=np.nan, right=np.nan)
+                for _, entry_frequency, spectra in entries
+            ]
+        )
+        # Channels without any observation stay NaN
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanmedian(stack, axis=0)
@@ -0,0 +1,217 @@
+import copy
+import math
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+# Same spacing as plotly express uses for wrapped facets
+HORIZONTAL_SPACING = 0.02
+VERTICAL_SPACING = 0.07
+
+
+@lru_cache(maxsize=None)
+def _template_json(name):
+    return pio.templates[name].to_plotly_json()
+
+
+def get_template(name):
+    """Template as plain dict, converted once per template
+
+    Every figure gets its own copy, as figures are dicts that callers are free to modify.
+    """
+    return copy.deepcopy(_template_json(name))
+
+
+def _domains(n, spacing):
+    """Start & end of n equally sized cells along [0, 1]"""
+    size = (1 - spacing * (n - 1)) / n
+    domains, start = [], 0.0
+    for _ in range(n):
+        domains.append([start, start + size])
+        start = start + size + spacing
+    return domains
+
+
+def _facet_layout(facet_values, facet_label, facet_col_wrap, x_title, y_title):
+    """Axes & annotations of a grid of facets, laid out like plotly express does
+
+    Facets fill the grid row by row from the top, while subplots are numbered from the bottom.
+    Returns the layout dict & the subplot number of every facet.
+    """
+    n_facets = max(len(facet_values), 1)
+    ncols = min(facet_col_wrap, n_facets) if facet_col_wrap else n_facets
+    nrows = math.ceil(n_facets / ncols)
+    col_domains = _domains(ncols, HORIZONTAL_SPACING)
+    row_domains = _domains(nrows, VERTICAL_SPACING)
+
+    layout = {}
+    for row in range(nrows):
+        for col in range(ncols):
+            number = row * ncols + col + 1
+            suffix = "" if number == 1 else str(number)
+            xaxis = {"anchor": "y" + suffix, "domain": col_domains[col]}
+            yaxis = {"anchor": "x" + suffix, "domain": row_domains[row]}
+            if number > 1:
+                xaxis["matches"] = "x"
+                yaxis["matches"] = "y"
+            if row == 0:
+                xaxis["title"] = {"text": x_title}
+            else:
+                xaxis["showticklabels"] = False
+            if col == 0:
+                yaxis["title"] = {"text": y_title}
+            else:
+                yaxis["showticklabels"] = False
+            layout["xaxis" + suffix] = xaxis
+            layout["yaxis" + suffix] = yaxis
+
+    numbers, annotations = [], []
+    for i, value in enumerate(facet_values):
+        row, col = nrows - 1 - i // ncols, i % ncols
+        numbers.append(row * ncols + col + 1)
+        annotations.append(
+            {
+                "font": {},
+                "showarrow": False,
+                "text": "{}={}".format(facet_label, value),
+                "x": sum(col_domains[col]) / 2,
+                "xanchor": "center",
+                "xref": "paper",
+                "y": row_domains[row][1],
+                "yanchor": "bottom",
+                "yref": "paper",
+            }
+        )
+    if annotations:
+        # Ordered by subplot, as plotly express does
+        layout["annotations"] = [
+            a for _, a in sorted(zip(numbers, annotations), key=lambda t: t[0])
+        ]
+
+    return layout, numbers or [1]
+
+
+def _column_stack(columns):
+    if not columns:
+        return None
+    if all(np.issubdtype(col.dtype, np.number) for col in columns):
+        return np.column_stack(columns)
+    return np.column_stack([col.astype(object) for col in columns])
+
+
+def scatter(
+    data,
+    x,
+    y,
+    facet_col=None,
+    facet_col_wrap=0,
+    labels=None,
+    hover_name=None,
+    hover_data=None,
+    custom_data=None,
+    template="plotly_dark",
+):
+    """Wide-form scatter figure like px.scatter(..., render_mode="webgl"), built straight from arrays
+
+    `data` maps column names to arrays, e.g. a DataFrame or a dict of NumPy arrays. Every column in
+    `y` becomes one Scattergl trace per facet, without melting the data into long form first. The
+    figure is returned as a plain dict, which skips plotly's validation, so datetime columns are
+    converted to ISO strings here.
+    """
+    labels = labels or {}
+    hover_data = hover_data or {}
+    custom_data = list(custom_data or [])
+
+    def label(col):
+        return labels.get(col, col)
+
+    def column(col):
+        values = np.asarray(data[col])
+        if values.dtype.kind == "M":
+            # Without plotly's validation, datetimes would be serialized as integer nanoseconds
+            return np.datetime_as_string(values)
+        return values
+
+    # Facet rows in order of appearance
+    if facet_col is not None:
+        codes, facet_values = pd.factorize(column(facet_col))
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(facet_values) + 1))
+        facet_rows = [order[bounds[i] : bounds[i + 1]] for i in range(len(facet_values))]
+    else:
+        facet_values, facet_rows = [], [slice(None)]
+
+    layout, numbers = _facet_layout(
+        list(facet_values), label(facet_col), facet_col_wrap, label(x), label("value")
+    )
+
+    # Hover data goes after the custom data, just as with plotly express
+    hover_cols = [
+        col
+        for col, fmt in hover_data.items()
+        if fmt is not False and col not in [x, "value"] + list(y)
+    ]
+    customdata_cols = custom_data + [col for col in hover_cols if col not in custom_data]
+    customdata = _column_stack([column(col) for col in customdata_cols])
+    hovertext = column(hover_name) if hover_name else None
+    x_values = column(x)
+
+    template = get_template(template)
+    colorway = template["layout"]["colorway"]
+    traces = []
+    for i, y_col in enumerate(y):
+        y_values = column(y_col)
+        for j, (rows, number) in enumerate(zip(facet_rows, numbers)):
+            suffix = "" if number == 1 else str(number)
+
+            hover_lines = ["{}={}".format(label("variable"), y_col)]
+            if facet_col is not None:
+                hover_lines.append("{}={}".format(label(facet_col), facet_values[j]))
+            if hover_data.get(x, True) is not False:
+                hover_lines.append("{}=%{{x}}".format(label(x)))
+            hover_lines.append("{}=%{{y}}".format(label("value")))
+            for col in hover_cols:
+                fmt = hover_data[col] if isinstance(hover_data[col], str) else ""
+                hover_lines.append(
+                    "{}=%{{customdata[{}]{}}}".format(label(col), customdata_cols.index(col), fmt)
+                )
+            hovertemplate = "<br>".join(hover_lines) + "<extra></extra>"
+
+            trace = {
+                "hovertemplate": hovertemplate,
+                "legendgroup": y_col,
+                "marker": {"color": colorway[i % len(colorway)], "symbol": "circle"},
+                "mode": "markers",
+                "name": y_col,
+                "showlegend": j == 0,
+                "x": x_values[rows],
+                "xaxis": "x" + suffix,
+                "y": y_values[rows],
+                "yaxis": "y" + suffix,
+                "type": "scattergl",
+            }
+            if customdata is not None:
+                trace["customdata"] = customdata[rows]
+            if hovertext is not None:
+                trace["hovertext"] = hovertext[rows]
+                trace["hovertemplate"] = "<b>%{hovertext}</b><br><br>" + hovertemplate
+            traces.append(trace)
+
+    layout.update(
+        {
+            "template": template,
+            "legend": {"title": {"text": label("variable")}, "tracegroupgap": 0},
+            "margin": {"t": 60},
+        }
+    )
+    return {"data": traces, "layout": layout}
+
+
+def update_axes(figure, axis, **kwargs):
+    """Like fig.update_xaxes (axis="x") or fig.update_yaxes (axis="y"), for dict figures"""
+    for key, value in figure["layout"].items():
+        if key.startswith(axis + "axis"):
+            value.update(kwargs)
+    return figure
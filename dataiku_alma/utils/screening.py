@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+import utils.spectra as spectra
+
+# Robust z-score beyond which a statistic counts as anomalous
+MAD_THRESHOLD = 5.0
+# Scales the MAD to the standard deviation of normally distributed values
+MAD_SCALE = 1.4826
+
+SUMMARY_COLUMNS = ["trec_x", "trec_y", "tsys_x", "tsys_y"]
+# Spikes & ripples show up as large channel to channel jumps
+SPIKINESS_COLUMNS = ["trecspectrum_x", "trecspectrum_y", "tsysspectrum_x", "tsysspectrum_y"]
+
+GROUP_COLUMNS = ["uid", "antennaname", "basebandname"]
+
+
+def robust_zscores(values):
+    """(value - median) / scaled MAD, all 0 if most values agree exactly"""
+    values = np.asarray(values, dtype=float)
+    median = np.nanmedian(values)
+    mad = MAD_SCALE * np.nanmedian(np.abs(values - median))
+    if not mad > 0:
+        return np.zeros_like(values)
+    return (values - median) / mad
+
+
+def spikiness(values):
+    """RMS of the channel to channel differences of every spectrum"""
+    return np.array([np.sqrt(np.mean(np.diff(arr) ** 2)) if len(arr) > 1 else 0 for arr in values])
+
+
+def row_stats(df):
+    """Per row summary values & spikiness of the spectra, without the spectra themselves
+
+    Only needs one batch of rows at a time, so a UID can be screened with bounded memory.
+    """
+    decoded = spectra.decode_spectra(df, columns=SPIKINESS_COLUMNS)
+    stats = df[GROUP_COLUMNS + ["caldataid", "is_outlier"] + SUMMARY_COLUMNS].copy()
+    for col in SPIKINESS_COLUMNS:
+        stats[col.replace("spectrum", "_spikiness")] = spikiness(decoded[col])
+    return stats
+
+
+def screen(stats, threshold=MAD_THRESHOLD):
+    """Summary statistics & anomaly flags per antenna & baseband
+
+    Within every scan & baseband, each statistic of an antenna is compared with those of the other
+    antennas via robust z-scores. Antennas with any |z| beyond threshold in any scan are flagged.
+    """
+    stat_columns = [col for col in stats.columns if col not in GROUP_COLUMNS + ["caldataid"]]
+    stat_columns.remove("is_outlier")
+    z_columns = [col + "_z" for col in stat_columns]
+
+    scans = stats.groupby(["basebandname", "caldataid"])
+    z = pd.DataFrame(
+        {z_col: scans[col].transform(robust_zscores) for col, z_col in zip(stat_columns, z_columns)}
+    ).abs()
+    flags = z > threshold
+    stats = stats.assign(
+        max_abs_z=z.max(axis=1),
+        anomalous_scan=flags.any(axis=1),
+        anomalies=[
+            set(col for col, flagged in zip(stat_columns, row) if flagged)
+            for row in flags.to_numpy()
+        ],
+    )
+
+    report = (
+        stats.groupby(GROUP_COLUMNS)
+        .agg(
+            n_scans=("caldataid", "nunique"),
+            **{col: (col, "median") for col in stat_columns},
+            outlier_fraction=("is_outlier", "mean"),
+            max_abs_z=("max_abs_z", "max"),
+            n_anomalous_scans=("anomalous_scan", "sum"),
+            anomalies=("anomalies", lambda sets: ",".join(sorted(set().union(*sets)))),
+        )
+        .reset_index()
+    )
+    report["anomalous"] = report.n_anomalous_scans > 0
+    return report
+
+
+def screen_frames(frames, threshold=MAD_THRESHOLD):
+    """Screen the rows of a UID given as an iterable of DataFrames"""
+    stats = [row_stats(df) for df in frames]
+    if not stats:
+        return pd.DataFrame()
+    return screen(pd.concat(stats, ignore_index=True), threshold)
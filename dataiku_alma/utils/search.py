@@ -0,0 +1,46 @@
+from bisect import bisect_left
+
+
+class OptionIndex:
+    """Prefix & substring search over dropdown options, so only a page of them goes to the browser"""
+
+    def __init__(self, options):
+        self.options = options
+        self._labels = [str(option["label"]).lower() for option in options]
+        self._order = sorted(range(len(options)), key=lambda i: self._labels[i])
+        self._sorted_labels = [self._labels[i] for i in self._order]
+
+    def __len__(self):
+        return len(self.options)
+
+    def search(self, query, limit=50):
+        """Up to `limit` options, those whose label starts with query first, then those containing it"""
+        if not query:
+            return self.options[:limit]
+        query = str(query).lower()
+
+        # Prefix matches are a contiguous run of the sorted labels
+        matches = []
+        for pos in range(bisect_left(self._sorted_labels, query), len(self._sorted_labels)):
+            if len(matches) == limit or not self._sorted_labels[pos].startswith(query):
+                break
+            matches.append(self._order[pos])
+
+        if len(matches) < limit:
+            prefix_matches = set(matches)
+            for i, label in enumerate(self._labels):
+                if query in label and i not in prefix_matches:
+                    matches.append(i)
+                    if len(matches) == limit:
+                        break
+
+        return [self.options[i] for i in matches]
+
+
+def with_selected(options, index, values):
+    """Add the options of the selected values, the dropdown can only display values it has options for"""
+    values = set(values or [])
+    missing = values - set(option["value"] for option in options)
+    if not missing:
+        return options
+    return [option for option in index.options if option["value"] in missing] + options
@@ -0,0 +1,87 @@
+import numpy as np
+
+# Spectra are stored as comma-separated strings in the database
+SPECTRUM_COLUMNS = [
+    "frequencyspectrum",
+    "trecspectrum_x",
+    "trecspectrum_y",
+    "tsysspectrum_x",
+    "tsysspectrum_y",
+]
+
+# Suffix of decoded spectra kept next to the stored strings, e.g. in the disk cache
+DECODED_SUFFIX = "_decoded"
+
+
+def decode_spectrum(arr):
+    """Turn a stored spectrum string into floats, dropping the 5 edge channels on each side"""
+    return np.array(arr.split(",")[5:-5]).astype(float)
+
+
+def decode_spectra(df, columns=SPECTRUM_COLUMNS):
+    """Copy of df with the spectrum columns decoded into arrays, reusing already decoded ones"""
+    df = df.copy()
+    for col in columns:
+        if col + DECODED_SUFFIX in df:
+            df[col] = df.pop(col + DECODED_SUFFIX)
+        else:
+            df[col] = [decode_spectrum(arr) for arr in df[col]]
+    return df
+
+
+def with_decoded_spectra(df, columns=SPECTRUM_COLUMNS):
+    """Copy of df with the decoded spectra added next to the stored strings, e.g. for exports"""
+    return df.assign(
+        **{col + DECODED_SUFFIX: [decode_spectrum(arr) for arr in df[col]] for col in columns}
+    )
+
+
+def frame_bytes(df, columns=SPECTRUM_COLUMNS):
+    """Memory held by a df with decoded spectra, counting the arrays behind its spectrum columns"""
+    arrays = sum(getattr(arr, "nbytes", 0) for col in columns if col in df for arr in df[col])
+    return int(df.memory_usage().sum()) + arrays
+
+
+def waterfall_image(
+    frequencies,
+    values,
+    scan_positions,
+    n_scans,
+    scan_bins=200,
+    frequency_bins=400,
+    groups=None,
+    n_groups=1,
+):
+    """Average spectra into a fixed-size scan x frequency image, e.g. for a heatmap
+
+    `frequencies` & `values` hold one spectrum (array) per row, `scan_positions` the position of the
+    row's scan in time order out of n_scans. Scans beyond `scan_bins` share image rows, so the image
+    size does not depend on the number of scans or channels. `groups` optionally holds the group of
+    every row out of n_groups, e.g. its antenna, every group gets its own block of scan rows so the
+    spectra of different groups are never averaged together. Returns the image (NaN where empty,
+    group after group), the frequency bin centers & the first scan position of every image row of
+    a group.
+    """
+    lengths = np.array([len(arr) for arr in frequencies])
+    frequency = np.concatenate(frequencies)
+    value = np.concatenate(values)
+
+    n_rows = min(n_scans, scan_bins)
+    rows = np.asarray(scan_positions) * n_rows // n_scans
+    if groups is not None:
+        rows = rows + np.asarray(groups) * n_rows
+    rows = np.repeat(rows, lengths)
+
+    f_min, f_max = frequency.min(), frequency.max()
+    edges = np.linspace(f_min, f_max, frequency_bins + 1)
+    cols = np.clip(np.searchsorted(edges, frequency, side="right") - 1, 0, frequency_bins - 1)
+
+    n_cells = n_groups * n_rows * frequency_bins
+    cells = rows * frequency_bins + cols
+    sums = np.bincount(cells, weights=value, minlength=n_cells)
+    counts = np.bincount(cells, minlength=n_cells)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        image = (sums / counts).reshape(n_groups * n_rows, frequency_bins)
+
+    row_starts = -(-np.arange(n_rows) * n_scans // n_rows)
+    return image, (edges[:-1] + edges[1:]) / 2, row_starts
@@ -0,0 +1,83 @@
+from itertools import islice
+
+import pandas as pd
+
+# Without pyarrow the batches are built as plain DataFrames
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Rows per batch, a few thousand rows with spectra are some MBs
+BATCH_SIZE = 2000
+
+
+def _iter_chunks(executor, query, batch_size):
+    """Column names & lists of up to batch_size row tuples, streamed from the database
+
+    See: https://doc.dataiku.com/dss/latest/python-api/sql.html
+    """
+    reader = executor.query_to_iter(query)
+    names = [column["name"] for column in reader.get_schema()]
+    rows = reader.iter_tuples()
+    chunks = iter(lambda: list(islice(rows, batch_size)), [])
+    return names, chunks
+
+
+def iter_batches(executor, query, batch_size=BATCH_SIZE, schema=None):
+    """Results of a query as Arrow record batches
+
+    With a schema every batch gets its types. Otherwise they are inferred, & once a column had
+    values its type is kept, so a later batch where it is all NULL still gets it. Columns that were
+    all NULL so far have the null type, concat_batches unifies them with the later batches.
+    """
+    names, chunks = _iter_chunks(executor, query, batch_size)
+    if schema is not None:
+        types = [schema.field(name).type for name in names]
+    else:
+        types = [None] * len(names)
+    for chunk in chunks:
+        arrays = [pa.array(col, type=type_) for col, type_ in zip(zip(*chunk), types)]
+        types = [
+            array.type if type_ is None and array.type != pa.null() else type_
+            for array, type_ in zip(arrays, types)
+        ]
+        yield pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def concat_batches(batches):
+    """One Arrow table of record batches, columns all NULL in some batches get the type of others"""
+    schema = pa.unify_schemas([batch.schema for batch in batches])
+    return pa.concat_tables([pa.Table.from_batches([batch]).cast(schema) for batch in batches])
+
+
+def iter_frames(executor, query, batch_size=BATCH_SIZE):
+    """Results of a query as DataFrames of up to batch_size rows"""
+    if pa is not None:
+        for batch in iter_batches(executor, query, batch_size):
+            yield batch.to_pandas()
+    else:
+        names, chunks = _iter_chunks(executor, query, batch_size)
+        for chunk in chunks:
+            yield pd.DataFrame.from_records(chunk, columns=names)
+
+
+def read_df(executor, query, batch_size=BATCH_SIZE):
+    """Results of a query as one DataFrame, like query_to_df but streamed in batches
+
+    SQLExecutor2 only hands out rows as Python tuples, so these are turned into Arrow a batch at a
+    time & only one batch of tuples exists at once. The Arrow table is converted column by column,
+    freeing each column once converted, so the rows are not held twice at the end either.
+    """
+    if pa is not None:
+        batches = list(iter_batches(executor, query, batch_size))
+        if batches:
+            table = concat_batches(batches)
+            del batches
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+    else:
+        frames = list(iter_frames(executor, query, batch_size))
+        if frames:
+            return pd.concat(frames, ignore_index=True)
+    # No rows, query_to_df still gives the columns
+    return executor.query_to_df(query)
@@ -0,0 +1,144 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# 66 antennas as in the array: 25 12m DA & DV, 12 7m CM & 4 total power PM antennas
+ANTENNAS = (
+    ["DA%d" % i for i in range(41, 66)]
+    + ["DV%02d" % i for i in range(1, 26)]
+    + ["CM%02d" % i for i in range(1, 13)]
+    + ["PM%02d" % i for i in range(1, 5)]
+)
+
+BASEBANDS = ["BB_1", "BB_2", "BB_3", "BB_4"]
+
+# Stored spectra carry 5 extra edge channels on each side, which the app drops
+EDGE_CHANNELS = 5
+
+
+def _format_spectra(arr):
+    return [",".join("%.4f" % v for v in row) for row in arr]
+
+
+def generate_uid(
+    uid,
+    start,
+    n_scans=10,
+    n_channels=128,
+    antennas=ANTENNAS,
+    basebands=BASEBANDS,
+    outlier_fraction=0.01,
+    seed=0,
+):
+    """Realistic `raw_cal_joined` rows of one observation, see alma_dss.sql for the columns
+
+    Every scan has a row per antenna & baseband. A fraction of the rows gets a hot receiver,
+    i.e. elevated & spiky temperatures, & is flagged via `is_outlier`.
+    """
+    rng = np.random.RandomState(seed)
+    n_ant, n_bb = len(antennas), len(basebands)
+    n_rows = n_scans * n_ant * n_bb
+    n_stored = n_channels + 2 * EDGE_CHANNELS
+
+    scan_idx = np.repeat(np.arange(n_scans), n_ant * n_bb)
+    ant_idx = np.tile(np.repeat(np.arange(n_ant), n_bb), n_scans)
+    bb_idx = np.tile(np.arange(n_bb), n_scans * n_ant)
+    startvalidtime = pd.Timestamp(start) + pd.to_timedelta(scan_idx * 90, unit="s")
+
+    # Band 3, each baseband covers 2GHz of its own
+    frequency_min = 84e9 + bb_idx * 2.5e9
+    frequency = frequency_min[:, None] + np.linspace(0, 2e9, n_stored)[None, :]
+
+    # Per antenna receiver temperature with a ripple over the band & channel noise, receivers are
+    # hardware so their temperatures are the same in every observation
+    ant_trec = np.random.RandomState(len(antennas)).uniform(30, 60, n_ant)[ant_idx]
+    ripple = 1 + 0.05 * np.sin(np.linspace(0, 6 * np.pi, n_stored))[None, :]
+    trec_x = ant_trec[:, None] * ripple + rng.normal(0, 0.5, (n_rows, n_stored))
+    trec_y = ant_trec[:, None] * 1.03 * ripple + rng.normal(0, 0.5, (n_rows, n_stored))
+    tau = np.clip(rng.normal(0.05, 0.01, n_scans), 0.01, None)[scan_idx]
+    tsys_x = (trec_x + 270 * (1 - np.exp(-tau[:, None]))) * np.exp(tau[:, None])
+    tsys_y = (trec_y + 270 * (1 - np.exp(-tau[:, None]))) * np.exp(tau[:, None])
+
+    is_outlier = rng.uniform(size=n_rows) < outlier_fraction
+    spikes = rng.uniform(size=(is_outlier.sum(), n_stored)) < 0.02
+    for arr in [trec_x, trec_y, tsys_x, tsys_y]:
+        arr[is_outlier] *= 3
+        arr[is_outlier] += spikes * 500
+
+    channels = slice(EDGE_CHANNELS, -EDGE_CHANNELS)
+    return pd.DataFrame(
+        {
+            "uid": uid,
+            "antennaname": np.asarray(antennas)[ant_idx],
+            "basebandname": np.asarray(basebands)[bb_idx],
+            "caldataid": scan_idx + 1,
+            "receiverband": "ALMA_RB_03",
+            "day": startvalidtime.strftime("%Y-%m-%d"),
+            "startvalidtime": startvalidtime.strftime("%Y-%m-%d %H:%M:%S"),
+            "tatm_x": rng.normal(270, 2, n_rows),
+            "tatm_y": rng.normal(270, 2, n_rows),
+            "trec_x": trec_x[:, channels].mean(axis=1),
+            "trec_y": trec_y[:, channels].mean(axis=1),
+            "tsys_x": tsys_x[:, channels].mean(axis=1),
+            "tsys_y": tsys_y[:, channels].mean(axis=1),
+            "tau": tau,
+            "water": rng.normal(1.5, 0.2, n_scans)[scan_idx],
+            "is_outlier": is_outlier,
+            "frequency_min": frequency_min,
+            "frequency_mid": frequency_min + 1e9,
+            "frequency_max": frequency_min + 2e9,
+            "trecspectrum_x": _format_spectra(trec_x),
+            "trecspectrum_y": _format_spectra(trec_y),
+            "tsysspectrum_x": _format_spectra(tsys_x),
+            "tsysspectrum_y": _format_spectra(tsys_y),
+            "frequencyspectrum": _format_spectra(frequency),
+        }
+    )
+
+
+def generate_dataset(n_uids=3, start="2021-08-01", seed=0, **kwargs):
+    """Rows of n_uids observations, one per day starting at `start`"""
+    return pd.concat(
+        [
+            generate_uid(
+                "uid://A002/Xf27c/X%x" % (0x100 + i),
+                pd.Timestamp(start) + pd.Timedelta(days=i, hours=2),
+                seed=seed + i,
+                **kwargs,
+            )
+            for i in range(n_uids)
+        ],
+        ignore_index=True,
+    )
+
+
+class SQLiteExecutor:
+    """Runs the app's queries against an in-memory SQLite copy of a DataFrame
+
+    Mirrors the `query_to_df` & `query_to_iter` methods of Dataiku's SQLExecutor2, so the app can
+    run outside DSS.
+    """
+
+    def __init__(self, df, table):
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        df.to_sql(table, self.connection, index=False)
+
+    def query_to_df(self, query):
+        return pd.read_sql(query, self.connection)
+
+    def query_to_iter(self, query):
+        return SQLiteQueryReader(self.connection.execute(query))
+
+
+class SQLiteQueryReader:
+    """Streamed query results, like the reader returned by SQLExecutor2.query_to_iter"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def get_schema(self):
+        return [{"name": column[0]} for column in self.cursor.description]
+
+    def iter_tuples(self):
+        return iter(self.cursor)
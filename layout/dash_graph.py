@@ -7,6 +7,8 @@ import dash_html_components as html
 import plotly.express as px
 import pandas as pd
 
+from layout_cache import cache_layout
+
 
 external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 
@@ -29,5 +31,8 @@ fig = px.scatter(
 
 app.layout = html.Div([dcc.Graph(id="life-exp-vs-gdp", figure=fig)])
 
+# Serialize the static layout once instead of on every page load
+cache_layout(app)
+
 if __name__ == "__main__":
     app.run_server(debug=True)
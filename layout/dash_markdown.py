@@ -5,6 +5,8 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 
+from layout_cache import cache_layout
+
 external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
@@ -23,5 +25,8 @@ if this is your first introduction to Markdown!
 
 app.layout = html.Div([dcc.Markdown(children=markdown_text)])
 
+# Serialize the static layout once instead of on every page load
+cache_layout(app)
+
 if __name__ == "__main__":
     app.run_server(debug=True)
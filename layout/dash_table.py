@@ -5,6 +5,8 @@ import dash
 import dash_html_components as html
 import pandas as pd
 
+from layout_cache import cache_layout
+
 df = pd.read_csv(
     "https://gist.githubusercontent.com/chriddyp/c78bf172206ce24f77d6363a2d754b59/raw/c353e8ef842413cae56ae3920b8fd78468aa4cb2/usa-agricultural-exports-2011.csv"
 )
@@ -32,5 +34,8 @@ app.layout = html.Div(
     children=[html.H4(children="US Agriculture Exports (2011)"), generate_table(df)]
 )
 
+# Serialize the static layout once instead of on every page load
+cache_layout(app)
+
 if __name__ == "__main__":
     app.run_server(debug=True)
@@ -9,6 +9,8 @@ import dash_html_components as html
 import plotly.express as px
 import pandas as pd
 
+from layout_cache import cache_layout
+
 external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
@@ -39,5 +41,8 @@ app.layout = html.Div(
     ],
 )
 
+# Serialize the static layout once instead of on every page load
+cache_layout(app)
+
 if __name__ == "__main__":
     app.run_server(debug=True)
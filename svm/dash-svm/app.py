@@ -1,17 +1,29 @@
+import os
+import threading
 import time
 import importlib
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import numpy as np
-from dash.dependencies import Input, Output, State
-from sklearn.model_selection import train_test_split
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import RidgeClassifier
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import StandardScaler
-from sklearn import datasets
+from sklearn import datasets, metrics
 from sklearn.svm import SVC
 
+import utils.caching as caching
 import utils.dash_reusable_components as drc
+import utils.evaluation as evaluation
 import utils.figures as figs
 
 app = dash.Dash(
@@ -20,6 +32,7 @@ app = dash.Dash(
         {"name": "viewport", "content": "width=device-width, initial-scale=1.0"}
     ],
 )
+app.config.suppress_callback_exceptions = True
 app.title = "Support Vector Machine"
 server = app.server
 
@@ -55,6 +68,375 @@ def generate_data(n_samples, dataset, noise):
         )
 
 
+# Moving a slider back & forth revisits the same settings, so keep the prepared data & the
+# fitted models around. Data keyed by (dataset, noise, sample_size), models by the data key
+# & the hyperparameters
+DATA_CACHE = caching.LRUCache(maxsize=32)
+MODEL_CACHE = caching.LRUCache(maxsize=128)
+
+# Pixels along each side of the decision function contour
+MESH_SIZE = 129
+
+
+def prepare_data(dataset, noise, sample_size):
+    """Scaled train/test split & the x & y ranges of the mesh around the data"""
+
+    def compute():
+        X, y = generate_data(n_samples=sample_size, dataset=dataset, noise=noise)
+        X = StandardScaler().fit_transform(X)
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.4, random_state=42
+        )
+
+        x_min = X[:, 0].min() - 0.5
+        x_max = X[:, 0].max() + 0.5
+        y_min = X[:, 1].min() - 0.5
+        y_max = X[:, 1].max() + 0.5
+        return X_train, X_test, y_train, y_test, (x_min, x_max), (y_min, y_max)
+
+    return DATA_CACHE.get_or_compute((dataset, noise, sample_size), compute)
+
+
+# The first render of new settings fits on at most QUICK_SAMPLE_SIZE training points &
+# evaluates a QUICK_MESH_SIZE mesh, the full model follows in the background
+QUICK_SAMPLE_SIZE = 100
+QUICK_MESH_SIZE = 33
+
+# Latest render per browser session, refinements of older renders are abandoned
+REFINE_TOKENS = caching.LRUCache(maxsize=1024)
+
+
+class RefinementCancelled(Exception):
+    pass
+
+
+# Approximate mode maps the data onto APPROX_COMPONENTS kernel features (Nystroem) &
+# fits a linear classifier, checked against the exact SVC on APPROX_CHECK_SIZE points
+APPROX_COMPONENTS = 100
+APPROX_CHECK_SIZE = 1000
+CHECK_CACHE = caching.LRUCache(maxsize=32)
+
+# Beyond this many training or test points, the figures show a random subsample
+MAX_DISPLAY_POINTS = 2000
+
+
+def model_key(
+    data_key, kernel, degree, C, gamma, shrinking, approximate=False, quick=False
+):
+    # Parameters the kernel ignores don't change the model
+    return (
+        tuple(data_key),
+        kernel,
+        degree if kernel == "poly" else None,
+        C,
+        gamma if kernel != "linear" else None,
+        shrinking if not approximate else None,
+        approximate,
+        quick,
+    )
+
+
+def build_model(kernel, degree, C, gamma, shrinking, approximate=False, n_samples=None):
+    """Unfitted SVC, or its approximation for fitting on n_samples points"""
+    if not approximate:
+        return SVC(C=C, kernel=kernel, degree=degree, gamma=gamma, shrinking=shrinking)
+
+    # A least squares SVM on the kernel features: the ridge penalty 1 / C plays the role
+    # of C & decision_function has the sign convention of SVC's
+    n_components = min(APPROX_COMPONENTS, n_samples or APPROX_COMPONENTS)
+    features = Nystroem(
+        kernel=kernel,
+        gamma=gamma,
+        degree=degree,
+        coef0=0,
+        n_components=n_components,
+        random_state=0,
+    )
+    return make_pipeline(features, RidgeClassifier(alpha=1 / C))
+
+
+def model_params(
+    kernel,
+    degree,
+    C_coef,
+    C_power,
+    gamma_coef,
+    gamma_power,
+    dataset,
+    noise,
+    shrinking,
+    sample_size,
+    sample_size_power=0,
+    mode="exact",
+):
+    """train_model arguments for the slider & dropdown values"""
+    # Only approximate models scale to the sample sizes beyond the exact ones
+    approximate = mode == "approximate"
+    if approximate:
+        sample_size *= 10 ** sample_size_power
+    data_key = (dataset, noise, sample_size)
+    C = C_coef * 10 ** C_power
+    gamma = gamma_coef * 10 ** gamma_power
+    return [data_key, kernel, degree, C, gamma, shrinking == "True", approximate]
+
+
+def fit_and_evaluate(
+    data,
+    kernel,
+    degree,
+    C,
+    gamma,
+    shrinking,
+    approximate=False,
+    quick=False,
+    check=None,
+):
+    """Fitted SVM & its evaluation on the mesh, train & test data of prepare_data
+
+    With approximate, a kernel approximation is fitted instead, see build_model. With
+    quick, the model is fitted on a subsample & evaluated on a coarse mesh. check is
+    called between the stages of the fit & evaluation, raising to abandon them. Touches
+    none of the caches, so worker processes run it as well.
+    """
+    X_train, X_test, y_train, y_test, x_range, y_range = data
+    # The split is shuffled, so the first points are a random subsample
+    n_fit = min(QUICK_SAMPLE_SIZE, len(X_train)) if quick else len(X_train)
+    if quick:
+        # Only evaluated on the points the figures show
+        X_train, X_test = X_train[:MAX_DISPLAY_POINTS], X_test[:MAX_DISPLAY_POINTS]
+        y_test = y_test[:MAX_DISPLAY_POINTS]
+
+    # Train SVM
+    clf = build_model(kernel, degree, C, gamma, shrinking, approximate, n_fit)
+    clf.fit(X_train[:n_fit], y_train[:n_fit])
+    if check is not None:
+        check()
+
+    # Plot the decision boundary. For that, we will assign a color to each
+    # point in the mesh [x_min, x_max]x[y_min, y_max], refined around the boundary.
+    return clf, evaluation.Evaluation(
+        clf,
+        X_train,
+        X_test,
+        y_test,
+        x_range,
+        y_range,
+        mesh_size=QUICK_MESH_SIZE if quick else MESH_SIZE,
+        check=check,
+    )
+
+
+def train_model(
+    data_key,
+    kernel,
+    degree,
+    C,
+    gamma,
+    shrinking,
+    approximate=False,
+    quick=False,
+    check=None,
+):
+    """fit_and_evaluate on the data of data_key, cached"""
+    key = model_key(data_key, kernel, degree, C, gamma, shrinking, approximate, quick)
+
+    def compute():
+        # Already being fitted in the background, failed speculative fits are redone
+        pending = PENDING.get(key)
+        if pending is not None:
+            try:
+                return pending.result()
+            except Exception:
+                pass
+
+        return fit_and_evaluate(
+            prepare_data(*data_key),
+            kernel,
+            degree,
+            C,
+            gamma,
+            shrinking,
+            approximate,
+            quick,
+            check,
+        )
+
+    return MODEL_CACHE.get_or_compute(key, compute)
+
+
+# Slider positions covered by a sweep, as powers of 10
+SWEEP_C_POWERS = list(range(-2, 5))
+SWEEP_GAMMA_POWERS = list(range(-5, 1))
+
+# Speculative fits get a few low priority processes of their own & cross-validation its
+# own cores, so neither queues behind a sweep & speculation never holds up the others
+SPECULATIVE_WORKERS = 2
+SPECULATIVE_NICENESS = 10
+
+
+def lower_priority():
+    # Not available on Windows
+    if hasattr(os, "nice"):
+        os.nice(SPECULATIVE_NICENESS)
+
+
+POOL_OPTIONS = {
+    "sweep": dict(max_workers=os.cpu_count()),
+    "folds": dict(max_workers=os.cpu_count()),
+    "speculative": dict(
+        max_workers=min(SPECULATIVE_WORKERS, os.cpu_count()),
+        initializer=lower_priority,
+    ),
+}
+
+# Workers start from a fresh interpreter rather than a fork, which would copy PENDING &
+# the cache locks as some thread left them. Windows only has spawn
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# Created on first use
+POOLS = {}
+POOL_LOCK = threading.Lock()
+
+
+def get_pool(name):
+    with POOL_LOCK:
+        if name not in POOLS:
+            POOLS[name] = ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context(START_METHOD),
+                **POOL_OPTIONS[name],
+            )
+        return POOLS[name]
+
+
+# Models being fitted in the background by key, so they are never fitted twice
+PENDING = {}
+PENDING_LOCK = threading.Lock()
+
+# Slider domains, the neighbors of the last moved one are fitted speculatively
+NEIGHBOR_SLIDERS = {
+    "slider-svm-parameter-C-power": ("C_power", -2, 4),
+    "slider-svm-parameter-C-coef": ("C_coef", 1, 9),
+    "slider-svm-parameter-gamma-power": ("gamma_power", -5, 0),
+    "slider-svm-parameter-gamma-coef": ("gamma_coef", 1, 9),
+    "slider-svm-parameter-degree": ("degree", 2, 10),
+}
+
+
+def fit_model(data, params):
+    """fit_and_evaluate for a worker process, the result is cached by the caller"""
+    return fit_and_evaluate(data, *params[1:])
+
+
+def fit_fold(params, X_train, y_train, X_test, y_test):
+    """Test accuracy & AUC of one cross-validation fold, run in a worker process"""
+    _, kernel, degree, C, gamma, shrinking, approximate = params
+    model = build_model(kernel, degree, C, gamma, shrinking, approximate, len(X_train))
+    model.fit(X_train, y_train)
+    scores = model.decision_function(X_test)
+    return np.mean((scores > 0) == y_test), metrics.roc_auc_score(y_test, scores)
+
+
+def train_models(params_list):
+    """Fit all uncached models on the process pool & cache them"""
+    keys = {}
+    for params in params_list:
+        key = model_key(*params)
+        if key not in MODEL_CACHE and key not in PENDING:
+            keys.setdefault(key, params)
+    data = [prepare_data(*params[0]) for params in keys.values()]
+    results = get_pool("sweep").map(fit_model, data, keys.values())
+    for key, result in zip(keys, results):
+        MODEL_CACHE.set(key, result)
+
+
+def cache_result(key, future):
+    if not future.cancelled() and future.exception() is None:
+        MODEL_CACHE.set(key, future.result())
+    with PENDING_LOCK:
+        PENDING.pop(key, None)
+
+
+def cancel_speculation():
+    """Drop the speculative fits that have not started yet, e.g. to free the cores"""
+    with PENDING_LOCK:
+        futures = list(PENDING.values())
+    # Cancelling runs cache_result, which takes the lock
+    for future in futures:
+        future.cancel()
+
+
+def precompute_neighbors(slider, settings):
+    """Fit the models one step either side of slider in the background"""
+    if slider not in NEIGHBOR_SLIDERS:
+        return
+    name, low, high = NEIGHBOR_SLIDERS[slider]
+    current = model_key(*model_params(**settings))
+    for value in [settings[name] - 1, settings[name] + 1]:
+        if not low <= value <= high:
+            continue
+        params = model_params(**dict(settings, **{name: value}))
+        key = model_key(*params)
+        data = prepare_data(*params[0])
+        # Sliders the kernel ignores lead to the same model
+        with PENDING_LOCK:
+            if key == current or key in PENDING or key in MODEL_CACHE:
+                continue
+            PENDING[key] = future = get_pool("speculative").submit(
+                fit_model, data, params
+            )
+        future.add_done_callback(partial(cache_result, key))
+
+
+def approximation_check(data_key, kernel, degree, C, gamma, shrinking):
+    """How well the approximate model agrees with the exact SVC on a subsample"""
+    key = model_key(data_key, kernel, degree, C, gamma, shrinking)
+
+    def compute():
+        X_train, X_test, y_train, y_test, _, _ = prepare_data(*data_key)
+        n = min(APPROX_CHECK_SIZE, len(X_train))
+        predictions = []
+        for approximate in [False, True]:
+            model = build_model(kernel, degree, C, gamma, shrinking, approximate, n)
+            model.fit(X_train[:n], y_train[:n])
+            predictions.append(model.predict(X_test[:n]))
+        exact, approximation = predictions
+        return (
+            f"Compared with the exact SVC on {n} points, "
+            f"{np.mean(exact == approximation):.1%} of the test predictions agree "
+            f"(test accuracy {np.mean(approximation == y_test[:n]):.3f} vs "
+            f"{np.mean(exact == y_test[:n]):.3f})"
+        )
+
+    return CHECK_CACHE.get_or_compute(key, compute)
+
+
+def serve_figures(data_key, model_evaluation, threshold):
+    """Prediction, ROC & confusion matrix figures of an evaluated model"""
+    X_train, X_test, y_train, y_test, _, _ = prepare_data(*data_key)
+    # The split is shuffled, so the first points are a random subsample
+    n = MAX_DISPLAY_POINTS
+    X_train, X_test, y_train, y_test = X_train[:n], X_test[:n], y_train[:n], y_test[:n]
+    model_evaluation = model_evaluation.head(n)
+
+    prediction_figure = figs.serve_prediction_plot(
+        evaluation=model_evaluation,
+        X_train=X_train,
+        X_test=X_test,
+        y_train=y_train,
+        y_test=y_test,
+        threshold=threshold,
+    )
+
+    roc_figure = figs.serve_roc_curve(evaluation=model_evaluation)
+
+    confusion_figure = figs.serve_pie_confusion_matrix(
+        evaluation=model_evaluation, y_test=y_test, threshold=threshold
+    )
+    return prediction_figure, roc_figure, confusion_figure
+
+
 app.layout = html.Div(
     children=[
         # .container class is fixed, .container.scalable is scalable
@@ -135,6 +517,18 @@ app.layout = html.Div(
                                             },
                                             value=300,
                                         ),
+                                        drc.NamedSlider(
+                                            name="Sample Size Scale (Approximate)",
+                                            id="slider-dataset-sample-size-power",
+                                            min=0,
+                                            max=3,
+                                            marks={
+                                                i: "x{}".format(10 ** i)
+                                                for i in range(0, 4)
+                                            },
+                                            value=0,
+                                            disabled=True,
+                                        ),
                                         drc.NamedSlider(
                                             name="Noise Level",
                                             id="slider-dataset-noise-level",
@@ -260,10 +654,100 @@ app.layout = html.Div(
                                                 ),
                                             ],
                                         ),
+                                        drc.NamedRadioItems(
+                                            name="Training",
+                                            id="radio-svm-mode",
+                                            labelStyle={
+                                                "margin-right": "7px",
+                                                "display": "inline-block",
+                                            },
+                                            options=[
+                                                {"label": " Exact", "value": "exact"},
+                                                {
+                                                    "label": " Approximate",
+                                                    "value": "approximate",
+                                                },
+                                            ],
+                                            value="exact",
+                                        ),
+                                        html.P(id="approximation-report"),
+                                    ],
+                                ),
+                                drc.Card(
+                                    id="sweep-card",
+                                    children=[
+                                        html.Button(
+                                            "Sweep C x Gamma", id="button-sweep"
+                                        ),
+                                        drc.NamedRadioItems(
+                                            name="Sweep Metric",
+                                            id="radio-sweep-metric",
+                                            labelStyle={
+                                                "margin-right": "7px",
+                                                "display": "inline-block",
+                                            },
+                                            options=[
+                                                {
+                                                    "label": " Accuracy",
+                                                    "value": "accuracy",
+                                                },
+                                                {"label": " AUC", "value": "AUC"},
+                                            ],
+                                            value="accuracy",
+                                        ),
+                                        dcc.Store(id="sweep-results"),
+                                        dcc.Loading(
+                                            dcc.Graph(
+                                                id="graph-sweep-heatmap",
+                                                figure=dict(
+                                                    layout=dict(
+                                                        plot_bgcolor="#282b38",
+                                                        paper_bgcolor="#282b38",
+                                                        height=50,
+                                                    )
+                                                ),
+                                                config={"displayModeBar": False},
+                                            )
+                                        ),
+                                    ],
+                                ),
+                                drc.Card(
+                                    id="cv-card",
+                                    children=[
+                                        html.Button(
+                                            "Cross-Validate", id="button-cross-validate"
+                                        ),
+                                        drc.NamedSlider(
+                                            name="Folds",
+                                            id="slider-cv-folds",
+                                            min=2,
+                                            max=10,
+                                            value=5,
+                                            step=1,
+                                            marks={
+                                                str(i): str(i) for i in range(2, 11, 2)
+                                            },
+                                        ),
+                                        dcc.Loading(
+                                            dcc.Graph(
+                                                id="graph-cv-folds",
+                                                figure=dict(
+                                                    layout=dict(
+                                                        plot_bgcolor="#282b38",
+                                                        paper_bgcolor="#282b38",
+                                                        height=50,
+                                                    )
+                                                ),
+                                                config={"displayModeBar": False},
+                                            )
+                                        ),
                                     ],
                                 ),
                             ],
                         ),
+                        # Settings of the last render to refine & the refined figures
+                        dcc.Store(id="svm-refine-request"),
+                        dcc.Store(id="svm-refined-figures"),
                         html.Div(
                             id="div-graphs",
                             children=dcc.Graph(
@@ -301,18 +785,12 @@ def update_slider_svm_parameter_C_coef(power):
     return {i: str(round(i * scale, 8)) for i in range(1, 10, 2)}
 
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="svm", function_name="reset_threshold_center"),
     Output("slider-threshold", "value"),
     [Input("button-zero-threshold", "n_clicks")],
     [State("graph-sklearn-svm", "figure")],
 )
-def reset_threshold_center(n_clicks, figure):
-    if n_clicks:
-        Z = np.array(figure["data"][0]["z"])
-        value = -Z.min() / (Z.max() - Z.min())
-    else:
-        value = 0.4959986285375595
-    return value
 
 
 # Disable Sliders if kernel not in the given list
@@ -341,7 +819,15 @@ def disable_slider_param_gamma_power(kernel):
 
 
 @app.callback(
-    Output("div-graphs", "children"),
+    Output("slider-dataset-sample-size-power", "disabled"),
+    [Input("radio-svm-mode", "value")],
+)
+def disable_slider_sample_size_power(mode):
+    return mode != "approximate"
+
+
+@app.callback(
+    Output("approximation-report", "children"),
     [
         Input("dropdown-svm-parameter-kernel", "value"),
         Input("slider-svm-parameter-degree", "value"),
@@ -352,10 +838,37 @@ def disable_slider_param_gamma_power(kernel):
         Input("dropdown-select-dataset", "value"),
         Input("slider-dataset-noise-level", "value"),
         Input("radio-svm-parameter-shrinking", "value"),
-        Input("slider-threshold", "value"),
         Input("slider-dataset-sample-size", "value"),
+        Input("slider-dataset-sample-size-power", "value"),
+        Input("radio-svm-mode", "value"),
     ],
 )
+def update_approximation_report(*settings):
+    params = model_params(*settings)
+    if not params[-1]:
+        return ""
+    return approximation_check(*params[:-1])
+
+
+@app.callback(
+    [Output("div-graphs", "children"), Output("svm-refine-request", "data")],
+    [
+        Input("dropdown-svm-parameter-kernel", "value"),
+        Input("slider-svm-parameter-degree", "value"),
+        Input("slider-svm-parameter-C-coef", "value"),
+        Input("slider-svm-parameter-C-power", "value"),
+        Input("slider-svm-parameter-gamma-coef", "value"),
+        Input("slider-svm-parameter-gamma-power", "value"),
+        Input("dropdown-select-dataset", "value"),
+        Input("slider-dataset-noise-level", "value"),
+        Input("radio-svm-parameter-shrinking", "value"),
+        Input("slider-dataset-sample-size", "value"),
+        Input("slider-dataset-sample-size-power", "value"),
+        Input("radio-svm-mode", "value"),
+    ],
+    # The threshold is moved in the browser, by update_threshold in assets/clientside.js
+    [State("slider-threshold", "value"), State("svm-refine-request", "data")],
+)
 def update_svm_graph(
     kernel,
     degree,
@@ -366,62 +879,51 @@ def update_svm_graph(
     dataset,
     noise,
     shrinking,
-    threshold,
     sample_size,
+    sample_size_power,
+    mode,
+    threshold,
+    previous_request,
 ):
     t_start = time.time()
-    h = 0.3  # step size in the mesh
 
-    # Data Pre-processing
-    X, y = generate_data(n_samples=sample_size, dataset=dataset, noise=noise)
-    X = StandardScaler().fit_transform(X)
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.4, random_state=42
+    settings = dict(
+        kernel=kernel,
+        degree=degree,
+        C_coef=C_coef,
+        C_power=C_power,
+        gamma_coef=gamma_coef,
+        gamma_power=gamma_power,
+        dataset=dataset,
+        noise=noise,
+        shrinking=shrinking,
+        sample_size=sample_size,
+        sample_size_power=sample_size_power,
+        mode=mode,
     )
 
-    x_min = X[:, 0].min() - 0.5
-    x_max = X[:, 0].max() + 0.5
-    y_min = X[:, 1].min() - 0.5
-    y_max = X[:, 1].max() + 0.5
-    xx, yy = np.meshgrid(np.arange(x_min, x_max, h), np.arange(y_min, y_max, h))
-
-    C = C_coef * 10 ** C_power
-    gamma = gamma_coef * 10 ** gamma_power
+    # Every render supersedes the refinement of the previous one in this session
+    session = (previous_request or {}).get("session") or uuid.uuid4().hex
+    token = uuid.uuid4().hex
+    REFINE_TOKENS.set(session, token)
+    request = {"session": session, "token": token}
 
-    if shrinking == "True":
-        flag = True
-    else:
-        flag = False
+    # Only trains on the first visit of these settings, on which a quick model is shown
+    # until the full one is refined
+    params = model_params(**settings)
+    data_key = params[0]
+    quick = model_key(*params) not in MODEL_CACHE
+    if quick:
+        request.update(params=params, threshold=threshold)
+    clf, model_evaluation = train_model(*params, quick=quick)
 
-    # Train SVM
-    clf = SVC(C=C, kernel=kernel, degree=degree, gamma=gamma, shrinking=flag)
-    clf.fit(X_train, y_train)
-
-    # Plot the decision boundary. For that, we will assign a color to each
-    # point in the mesh [x_min, x_max]x[y_min, y_max].
-    if hasattr(clf, "decision_function"):
-        Z = clf.decision_function(np.c_[xx.ravel(), yy.ravel()])
-    else:
-        Z = clf.predict_proba(np.c_[xx.ravel(), yy.ravel()])[:, 1]
-
-    prediction_figure = figs.serve_prediction_plot(
-        model=clf,
-        X_train=X_train,
-        X_test=X_test,
-        y_train=y_train,
-        y_test=y_test,
-        Z=Z,
-        xx=xx,
-        yy=yy,
-        mesh_step=h,
-        threshold=threshold,
+    prediction_figure, roc_figure, confusion_figure = serve_figures(
+        data_key, model_evaluation, threshold
     )
 
-    roc_figure = figs.serve_roc_curve(model=clf, X_test=X_test, y_test=y_test)
-
-    confusion_figure = figs.serve_pie_confusion_matrix(
-        model=clf, X_test=X_test, y_test=y_test, Z=Z, threshold=threshold
-    )
+    # The next move of the same slider is likely one step either way
+    slider = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
+    precompute_neighbors(slider, settings)
 
     return [
         html.Div(
@@ -447,7 +949,189 @@ def update_svm_graph(
                 ),
             ],
         ),
+    ], request
+
+
+@app.callback(
+    Output("svm-refined-figures", "data"),
+    [Input("svm-refine-request", "data")],
+)
+def refine_svm_graph(request):
+    if not request or "params" not in request:
+        raise PreventUpdate
+
+    def check():
+        if REFINE_TOKENS.get(request["session"]) != request["token"]:
+            raise RefinementCancelled()
+
+    try:
+        _, model_evaluation = train_model(*request["params"], check=check)
+    except RefinementCancelled:
+        raise PreventUpdate
+
+    figures = serve_figures(
+        request["params"][0], model_evaluation, request["threshold"]
+    )
+    return {"token": request["token"], "figures": figures}
+
+
+# Swaps the refined figures in & moves the threshold without a server round trip
+app.clientside_callback(
+    ClientsideFunction(namespace="svm", function_name="update_threshold"),
+    [
+        Output("graph-sklearn-svm", "figure"),
+        Output("graph-line-roc-curve", "figure"),
+        Output("graph-pie-confusion-matrix", "figure"),
+    ],
+    [Input("svm-refined-figures", "data"), Input("slider-threshold", "value")],
+    [
+        State("svm-refine-request", "data"),
+        State("graph-sklearn-svm", "figure"),
+        State("graph-line-roc-curve", "figure"),
+        State("graph-pie-confusion-matrix", "figure"),
+    ],
+)
+
+
+@app.callback(
+    Output("sweep-results", "data"),
+    [Input("button-sweep", "n_clicks")],
+    [
+        State("dropdown-svm-parameter-kernel", "value"),
+        State("slider-svm-parameter-degree", "value"),
+        State("slider-svm-parameter-C-coef", "value"),
+        State("slider-svm-parameter-gamma-coef", "value"),
+        State("dropdown-select-dataset", "value"),
+        State("slider-dataset-noise-level", "value"),
+        State("radio-svm-parameter-shrinking", "value"),
+        State("slider-dataset-sample-size", "value"),
+        State("slider-dataset-sample-size-power", "value"),
+        State("radio-svm-mode", "value"),
+    ],
+)
+def run_sweep(
+    n_clicks,
+    kernel,
+    degree,
+    C_coef,
+    gamma_coef,
+    dataset,
+    noise,
+    shrinking,
+    sample_size,
+    sample_size_power,
+    mode,
+):
+    """Test accuracy & AUC of the whole C x gamma grid for the other current settings"""
+    if not n_clicks:
+        raise PreventUpdate
+
+    grid = [
+        [
+            model_params(
+                kernel,
+                degree,
+                C_coef,
+                C_power,
+                gamma_coef,
+                gamma_power,
+                dataset,
+                noise,
+                shrinking,
+                sample_size,
+                sample_size_power,
+                mode,
+            )
+            for gamma_power in SWEEP_GAMMA_POWERS
+        ]
+        for C_power in SWEEP_C_POWERS
+    ]
+    train_models([params for row in grid for params in row])
+    _, _, _, y_test, _, _ = prepare_data(*grid[0][0][0])
+
+    accuracy, auc = [], []
+    for row in grid:
+        evaluations = [train_model(*params)[1] for params in row]
+        accuracy.append([np.mean((ev.test_scores > 0) == y_test) for ev in evaluations])
+        auc.append([ev.auc for ev in evaluations])
+    return {"accuracy": accuracy, "AUC": auc}
+
+
+@app.callback(
+    Output("graph-sweep-heatmap", "figure"),
+    [
+        Input("sweep-results", "data"),
+        Input("radio-sweep-metric", "value"),
+        Input("slider-svm-parameter-C-power", "value"),
+        Input("slider-svm-parameter-gamma-power", "value"),
+    ],
+)
+def update_sweep_heatmap(results, metric, C_power, gamma_power):
+    if not results:
+        raise PreventUpdate
+    return figs.serve_sweep_heatmap(
+        SWEEP_C_POWERS,
+        SWEEP_GAMMA_POWERS,
+        results[metric],
+        metric,
+        C_power,
+        gamma_power,
+    )
+
+
+# The swept models are cached, so the selected one loads without training
+@app.callback(
+    [
+        Output("slider-svm-parameter-C-power", "value"),
+        Output("slider-svm-parameter-gamma-power", "value"),
+    ],
+    [Input("graph-sweep-heatmap", "clickData")],
+)
+def select_sweep_cell(click_data):
+    if not click_data:
+        raise PreventUpdate
+    point = click_data["points"][0]
+    return point["y"], point["x"]
+
+
+@app.callback(
+    Output("graph-cv-folds", "figure"),
+    [Input("button-cross-validate", "n_clicks")],
+    [
+        State("slider-cv-folds", "value"),
+        State("dropdown-svm-parameter-kernel", "value"),
+        State("slider-svm-parameter-degree", "value"),
+        State("slider-svm-parameter-C-coef", "value"),
+        State("slider-svm-parameter-C-power", "value"),
+        State("slider-svm-parameter-gamma-coef", "value"),
+        State("slider-svm-parameter-gamma-power", "value"),
+        State("dropdown-select-dataset", "value"),
+        State("slider-dataset-noise-level", "value"),
+        State("radio-svm-parameter-shrinking", "value"),
+        State("slider-dataset-sample-size", "value"),
+        State("slider-dataset-sample-size-power", "value"),
+        State("radio-svm-mode", "value"),
+    ],
+)
+def run_cross_validation(n_clicks, n_folds, *settings):
+    """Accuracy & AUC per fold of the current settings, the folds fitted in parallel"""
+    if not n_clicks:
+        raise PreventUpdate
+
+    params = model_params(*settings)
+    X_train, X_test, y_train, y_test, _, _ = prepare_data(*params[0])
+    X = np.concatenate([X_train, X_test])
+    y = np.concatenate([y_train, y_test])
+    folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42)
+
+    cancel_speculation()
+    futures = [
+        get_pool("folds").submit(fit_fold, params, X[train], y[train], X[test], y[test])
+        for train, test in folds.split(X, y)
     ]
+    results = [future.result() for future in futures]
+    accuracy, auc = [list(values) for values in zip(*results)]
+    return figs.serve_cv_folds(accuracy, auc)
 
 
 # Running the server
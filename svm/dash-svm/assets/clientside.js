@@ -0,0 +1,70 @@
+// Threshold changes are handled in the browser, from the scores the server ships in the
+// layout.meta of the prediction figure. Mirrors serve_prediction_plot & serve_pie_confusion_matrix
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    svm: {
+        update_threshold: function(refined, threshold, request, prediction, roc, pie) {
+            var dc = window.dash_clientside;
+            var rocUpdate = dc.no_update;
+
+            // Swaps the refined figures in, unless newer settings were rendered since
+            if (refined && request && refined.token === request.token) {
+                prediction = refined.figures[0];
+                rocUpdate = roc = refined.figures[1];
+                pie = refined.figures[2];
+            }
+            if (!prediction || !prediction.layout || !prediction.layout.meta || !pie) {
+                throw dc.PreventUpdate;
+            }
+
+            var meta = prediction.layout.meta;
+            var scaled = threshold * (meta.z_max - meta.z_min) + meta.z_min;
+            var range = Math.max(Math.abs(scaled - meta.z_min), Math.abs(scaled - meta.z_max));
+
+            function accuracy(scores, labels) {
+                var correct = 0;
+                for (var i = 0; i < scores.length; i++) {
+                    correct += (scores[i] > threshold ? 1 : 0) === labels[i] ? 1 : 0;
+                }
+                return correct / scores.length;
+            }
+
+            var data = prediction.data.slice();
+            data[0] = Object.assign({}, data[0], {zmin: scaled - range, zmax: scaled + range});
+            data[1] = Object.assign({}, data[1], {
+                contours: Object.assign({}, data[1].contours, {value: scaled}),
+                name: "Threshold (" + scaled.toFixed(3) + ")"
+            });
+            data[2] = Object.assign({}, data[2], {
+                name: "Training Data (accuracy=" +
+                    accuracy(meta.train_scores, meta.y_train).toFixed(3) + ")"
+            });
+            data[3] = Object.assign({}, data[3], {
+                name: "Test Data (accuracy=" +
+                    accuracy(meta.test_scores, meta.y_test).toFixed(3) + ")"
+            });
+
+            // [TP, FN, FP, TN]
+            var values = [0, 0, 0, 0];
+            for (var i = 0; i < meta.test_scores.length; i++) {
+                var predicted = meta.test_scores[i] > scaled;
+                values[(predicted ? 0 : 1) + (meta.y_test[i] ? 0 : 2)] += 1;
+            }
+            var pieData = pie.data.slice();
+            pieData[0] = Object.assign({}, pieData[0], {values: values});
+
+            return [
+                Object.assign({}, prediction, {data: data}),
+                rocUpdate,
+                Object.assign({}, pie, {data: pieData})
+            ];
+        },
+
+        reset_threshold_center: function(n_clicks, prediction) {
+            if (n_clicks && prediction && prediction.layout && prediction.layout.meta) {
+                var meta = prediction.layout.meta;
+                return -meta.z_min / (meta.z_max - meta.z_min);
+            }
+            return 0.4959986285375595;
+        }
+    }
+});
@@ -0,0 +1,57 @@
+import copy
+
+import numpy as np
+from sklearn import metrics
+
+from utils.mesh import adaptive_mesh, grid_decision
+
+
+class Evaluation:
+    """Decision scores of a fitted model on the mesh, train & test data & its ROC curve
+
+    The train & test scores come out of a single decision_function call & the mesh is
+    only evaluated densely around the decision boundary, from the support vectors
+    directly. Every figure is then built from this object without evaluating the model
+    again.
+    """
+
+    def __init__(
+        self,
+        model,
+        X_train,
+        X_test,
+        y_test,
+        x_range,
+        y_range,
+        mesh_size=129,
+        check=None,
+    ):
+        if hasattr(model, "decision_function"):
+            decision = model.decision_function
+        else:
+
+            def decision(points):
+                return model.predict_proba(points)[:, 1]
+
+        self.x = np.linspace(*x_range, mesh_size)
+        self.y = np.linspace(*y_range, mesh_size)
+        self.Z, self.n_evaluations = adaptive_mesh(
+            grid_decision(model, self.x, self.y, decision), size=mesh_size, check=check
+        )
+        scores = decision(np.concatenate([X_train, X_test]))
+        self.train_scores, self.test_scores = np.split(scores, [len(X_train)])
+        self.fpr, self.tpr, self.roc_thresholds = metrics.roc_curve(
+            y_test, self.test_scores
+        )
+        self.auc = metrics.roc_auc_score(y_true=y_test, y_score=self.test_scores)
+
+    def head(self, n):
+        """Copy with the scores of the first n training & test points only"""
+        evaluation = copy.copy(self)
+        evaluation.train_scores = self.train_scores[:n]
+        evaluation.test_scores = self.test_scores[:n]
+        return evaluation
+
+    def scale_threshold(self, threshold):
+        """Threshold in [0, 1] mapped onto the range of the mesh scores"""
+        return threshold * (self.Z.max() - self.Z.min()) + self.Z.min()
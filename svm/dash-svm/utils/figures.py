@@ -4,17 +4,17 @@ import numpy as np
 from sklearn import metrics
 
 
-def serve_prediction_plot(
-    model, X_train, X_test, y_train, y_test, Z, xx, yy, mesh_step, threshold
-):
-    # Get train and test score from model
-    y_pred_train = (model.decision_function(X_train) > threshold).astype(int)
-    y_pred_test = (model.decision_function(X_test) > threshold).astype(int)
+def serve_prediction_plot(evaluation, X_train, X_test, y_train, y_test, threshold):
+    Z = evaluation.Z
+
+    # Get train and test score from the model's evaluation
+    y_pred_train = (evaluation.train_scores > threshold).astype(int)
+    y_pred_test = (evaluation.test_scores > threshold).astype(int)
     train_score = metrics.accuracy_score(y_true=y_train, y_pred=y_pred_train)
     test_score = metrics.accuracy_score(y_true=y_test, y_pred=y_pred_test)
 
     # Compute threshold
-    scaled_threshold = threshold * (Z.max() - Z.min()) + Z.min()
+    scaled_threshold = evaluation.scale_threshold(threshold)
     range = max(abs(scaled_threshold - Z.min()), abs(scaled_threshold - Z.max()))
 
     # Colorscale
@@ -33,9 +33,9 @@ def serve_prediction_plot(
     # Create the plot
     # Plot the prediction contour of the SVM
     trace0 = go.Contour(
-        x=np.arange(xx.min(), xx.max(), mesh_step),
-        y=np.arange(yy.min(), yy.max(), mesh_step),
-        z=Z.reshape(xx.shape),
+        x=evaluation.x,
+        y=evaluation.y,
+        z=Z,
         zmin=scaled_threshold - range,
         zmax=scaled_threshold + range,
         hoverinfo="none",
@@ -47,9 +47,9 @@ def serve_prediction_plot(
 
     # Plot the threshold
     trace1 = go.Contour(
-        x=np.arange(xx.min(), xx.max(), mesh_step),
-        y=np.arange(yy.min(), yy.max(), mesh_step),
-        z=Z.reshape(xx.shape),
+        x=evaluation.x,
+        y=evaluation.y,
+        z=Z,
         showscale=False,
         hoverinfo="none",
         contours=dict(
@@ -88,6 +88,15 @@ def serve_prediction_plot(
         plot_bgcolor="#282b38",
         paper_bgcolor="#282b38",
         font={"color": "#a5b1cd"},
+        # For moving the threshold in the browser, see assets/clientside.js
+        meta=dict(
+            z_min=Z.min(),
+            z_max=Z.max(),
+            train_scores=evaluation.train_scores,
+            test_scores=evaluation.test_scores,
+            y_train=y_train,
+            y_test=y_test,
+        ),
     )
 
     data = [trace0, trace1, trace2, trace3]
@@ -96,12 +105,11 @@ def serve_prediction_plot(
     return figure
 
 
-def serve_roc_curve(model, X_test, y_test):
-    decision_test = model.decision_function(X_test)
-    fpr, tpr, threshold = metrics.roc_curve(y_test, decision_test)
+def serve_roc_curve(evaluation):
+    fpr, tpr = evaluation.fpr, evaluation.tpr
 
     # AUC Score
-    auc_score = metrics.roc_auc_score(y_true=y_test, y_score=decision_test)
+    auc_score = evaluation.auc
 
     trace0 = go.Scatter(
         x=fpr, y=tpr, mode="lines", name="Test Data", marker={"color": "#13c6e9"}
@@ -124,10 +132,10 @@ def serve_roc_curve(model, X_test, y_test):
     return figure
 
 
-def serve_pie_confusion_matrix(model, X_test, y_test, Z, threshold):
+def serve_pie_confusion_matrix(evaluation, y_test, threshold):
     # Compute threshold
-    scaled_threshold = threshold * (Z.max() - Z.min()) + Z.min()
-    y_pred_test = (model.decision_function(X_test) > scaled_threshold).astype(int)
+    scaled_threshold = evaluation.scale_threshold(threshold)
+    y_pred_test = (evaluation.test_scores > scaled_threshold).astype(int)
 
     matrix = metrics.confusion_matrix(y_true=y_test, y_pred=y_pred_test)
     tn, fp, fn, tp = matrix.ravel()
@@ -164,3 +172,71 @@ def serve_pie_confusion_matrix(model, X_test, y_test, Z, threshold):
     figure = go.Figure(data=data, layout=layout)
 
     return figure
+
+
+def serve_sweep_heatmap(C_powers, gamma_powers, scores, metric, C_power, gamma_power):
+    """Heatmap of a test metric over the C x gamma grid, the current setting outlined"""
+    trace0 = go.Heatmap(
+        x=gamma_powers,
+        y=C_powers,
+        z=scores,
+        zmin=0.5,
+        zmax=1,
+        colorscale="Viridis",
+        colorbar=dict(thickness=10),
+        hovertemplate="C = 1e%{y}<br>gamma = 1e%{x}<br>"
+        + metric
+        + " = %{z:.3f}<extra></extra>",
+    )
+
+    layout = go.Layout(
+        title=f"Test {metric}, click to select",
+        xaxis=dict(title="Gamma (power of 10)", dtick=1),
+        yaxis=dict(title="C (power of 10)", dtick=1),
+        shapes=[
+            dict(
+                type="rect",
+                x0=gamma_power - 0.5,
+                x1=gamma_power + 0.5,
+                y0=C_power - 0.5,
+                y1=C_power + 0.5,
+                line=dict(color="#ff744c", width=2),
+            )
+        ],
+        margin=dict(l=50, r=10, t=40, b=40),
+        height=350,
+        plot_bgcolor="#282b38",
+        paper_bgcolor="#282b38",
+        font={"color": "#a5b1cd"},
+    )
+
+    figure = go.Figure(data=[trace0], layout=layout)
+
+    return figure
+
+
+def serve_cv_folds(accuracy, auc):
+    """Test accuracy & AUC per cross-validation fold, with their mean & std"""
+    folds = [f"Fold {i + 1}" for i in range(len(accuracy))]
+
+    trace0 = go.Bar(x=folds, y=accuracy, name="Accuracy", marker={"color": "#13c6e9"})
+    trace1 = go.Bar(x=folds, y=auc, name="AUC", marker={"color": "#ff916d"})
+
+    layout = go.Layout(
+        title=(
+            f"Accuracy {np.mean(accuracy):.3f} ± {np.std(accuracy):.3f}<br>"
+            f"AUC {np.mean(auc):.3f} ± {np.std(auc):.3f}"
+        ),
+        barmode="group",
+        yaxis=dict(range=[min(min(accuracy), min(auc)) - 0.05, 1], gridcolor="#2f3445"),
+        legend=dict(x=0, y=-0.15, orientation="h"),
+        margin=dict(l=40, r=10, t=60, b=40),
+        height=350,
+        plot_bgcolor="#282b38",
+        paper_bgcolor="#282b38",
+        font={"color": "#a5b1cd"},
+    )
+
+    figure = go.Figure(data=[trace0, trace1], layout=layout)
+
+    return figure
@@ -0,0 +1,131 @@
+import numpy as np
+from sklearn.svm import SVC
+
+# Points per block when evaluating kernels other than RBF, bounds the kernel matrix
+CHUNK_SIZE = 4096
+
+
+def _upsample(Z):
+    """Bilinear interpolation of a grid onto the grid with twice the resolution"""
+    rows, cols = Z.shape
+    fine = np.empty((2 * rows - 1, 2 * cols - 1))
+    fine[::2, ::2] = Z
+    fine[1::2, ::2] = (Z[:-1] + Z[1:]) / 2
+    fine[::2, 1::2] = (Z[:, :-1] + Z[:, 1:]) / 2
+    fine[1::2, 1::2] = (Z[:-1, :-1] + Z[1:, :-1] + Z[:-1, 1:] + Z[1:, 1:]) / 4
+    return fine
+
+
+def adaptive_mesh(evaluate, size=129, coarse_size=17, tolerance=0.05, check=None):
+    """Decision function on a size x size grid, only evaluated where it matters
+
+    evaluate(rows, cols) returns the decision function at the given grid indices, e.g.
+    from grid_decision. Starts from a coarse_size x coarse_size grid & halves the step
+    until size is reached. Each time, only cells where the decision function changes
+    sign or varies by more than tolerance (relative to its overall range) are evaluated
+    at the finer step, the other cells are interpolated. size - 1 must be
+    coarse_size - 1 times a power of 2. check is called before every refinement, e.g.
+    to abandon the mesh by raising.
+
+    Returns the values & the number of evaluated points.
+    """
+    levels = int(np.log2((size - 1) // (coarse_size - 1)))
+    if (coarse_size - 1) * 2**levels != size - 1:
+        raise ValueError("size - 1 must be coarse_size - 1 times a power of 2")
+
+    stride = 2**levels
+    rows, cols = np.meshgrid(
+        np.arange(0, size, stride), np.arange(0, size, stride), indexing="ij"
+    )
+    Z = evaluate(rows.ravel(), cols.ravel()).reshape(rows.shape)
+    n_evaluations = Z.size
+    value_range = Z.max() - Z.min()
+
+    while stride > 1:
+        if check is not None:
+            check()
+
+        # Cells to refine, judged by their four corners
+        corners = np.stack([Z[:-1, :-1], Z[1:, :-1], Z[:-1, 1:], Z[1:, 1:]])
+        low, high = corners.min(axis=0), corners.max(axis=0)
+        refine = ((low < 0) & (high > 0)) | (high - low > tolerance * value_range)
+
+        Z = _upsample(Z)
+        stride //= 2
+
+        # The new points of the refined cells: edge midpoints & centers, each only once
+        new = np.zeros(Z.shape, dtype=bool)
+        cell_rows, cell_cols = np.nonzero(refine)
+        for d_row, d_col in [(0, 1), (1, 0), (1, 1), (1, 2), (2, 1)]:
+            new[2 * cell_rows + d_row, 2 * cell_cols + d_col] = True
+        new_rows, new_cols = np.nonzero(new)
+        if len(new_rows):
+            Z[new_rows, new_cols] = evaluate(new_rows * stride, new_cols * stride)
+            n_evaluations += len(new_rows)
+
+    return Z, n_evaluations
+
+
+def _kernel(model, points, support_vectors):
+    """Kernel matrix of an SVC between points & its support vectors"""
+    if model.kernel == "linear":
+        return points @ support_vectors.T
+    products = model._gamma * (points @ support_vectors.T) + model.coef0
+    if model.kernel == "poly":
+        if model.degree != int(model.degree) or model.degree < 1:
+            return products**model.degree
+        # Repeated products are much faster than ** on negative floats
+        powers = products.copy()
+        for _ in range(int(model.degree) - 1):
+            powers *= products
+        return powers
+    return np.tanh(products)
+
+
+def grid_decision(model, x, y, decision=None):
+    """evaluate(rows, cols) giving the decision function at (x[cols], y[rows])
+
+    For an RBF SVC, exp(-gamma * |p - s|^2) is the product of one factor per axis, so
+    the factors of every grid coordinate & support vector are computed once & the
+    values come out of a matrix product of the rows & columns involved, without any
+    exponentials per point. Other kernels of an SVC are evaluated from the support
+    vectors in float32 blocks of CHUNK_SIZE points. Other models fall back to
+    decision, by default their decision_function.
+    """
+    if not isinstance(model, SVC) or len(model.classes_) != 2:
+        decision = decision or model.decision_function
+
+        def evaluate(rows, cols):
+            return decision(np.c_[x[cols], y[rows]])
+
+    elif model.kernel == "rbf":
+        support_vectors = model.support_vectors_
+        gamma = model._gamma
+        # Per axis factors, with the dual coefficients folded into the x factors
+        x_factors = model.dual_coef_[0][:, None] * np.exp(
+            -gamma * (x[None, :] - support_vectors[:, :1]) ** 2
+        )
+        y_factors = np.exp(-gamma * (y[None, :] - support_vectors[:, 1:]) ** 2)
+
+        def evaluate(rows, cols):
+            # One product over the support vectors for all rows & columns involved
+            unique_rows, row_index = np.unique(rows, return_inverse=True)
+            unique_cols, col_index = np.unique(cols, return_inverse=True)
+            block = y_factors[:, unique_rows].T @ x_factors[:, unique_cols]
+            return block[row_index, col_index] + model.intercept_[0]
+
+    else:
+        support_vectors = model.support_vectors_.astype(np.float32)
+        dual_coef = model.dual_coef_[0].astype(np.float32)
+
+        def evaluate(rows, cols):
+            points = np.c_[x[cols], y[rows]].astype(np.float32)
+            values = np.empty(len(points))
+            for start in range(0, len(points), CHUNK_SIZE):
+                block = points[start : start + CHUNK_SIZE]
+                values[start : start + CHUNK_SIZE] = (
+                    _kernel(model, block, support_vectors) @ dual_coef
+                )
+            return values + model.intercept_[0]
+
+    return evaluate